@@ -3,13 +3,22 @@
 Utility script to add multiple Codeforces handles to the handles.txt file.
 """
 
-import os
 import sys
+import argparse
+import handle_registry
 
 HANDLES_FILE = "handles.txt"
 
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description=f"Add (or remove) Codeforces handles in {HANDLES_FILE}.")
+    parser.add_argument("--group", help="add the handles to this group")
+    parser.add_argument("--remove", action="store_true", help="remove the handles instead of adding them")
+    return parser.parse_args()
+
 def add_handles():
     """Add multiple handles to the handles.txt file."""
+    args = parse_args()
     print("Enter Codeforces handles (one per line). Press Ctrl+D (Unix) or Ctrl+Z (Windows) when done:")
     
     # Read handles from stdin
@@ -17,7 +26,8 @@ def add_handles():
     try:
         for line in sys.stdin:
             handle = line.strip()
-            if handle:
+            # Comments are skipped, so a handles file can be piped in
+            if handle and not handle.startswith("#"):
                 handles.append(handle)
     except KeyboardInterrupt:
         print("\nOperation cancelled.")
@@ -27,29 +37,36 @@ def add_handles():
         print("No handles provided. Exiting.")
         return
     
-    # Read existing handles to avoid duplicates
-    existing_handles = set()
-    if os.path.exists(HANDLES_FILE):
-        with open(HANDLES_FILE, "r") as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#"):
-                    existing_handles.add(line)
+    if args.remove:
+        removed = handle_registry.remove_handles(HANDLES_FILE, handles)
+        print(f"Removed {removed} handles from {HANDLES_FILE}.")
+        return
+    
+    # Use earlier validation results where there are any; nothing is sent to the API
+    cached = handle_registry.cached_validations(handles)
+    checked_handles = []
+    for handle in handles:
+        result = cached.get(handle_registry.normalize(handle))
+        if result is None:
+            checked_handles.append(handle)
+        elif result["status"] == "invalid":
+            print(f"  ✗ Skipping {handle}: not found on Codeforces when last validated.")
+        elif result["status"] == "renamed":
+            print(f"  ↪ {handle} was renamed to {result['handle']}; adding {result['handle']} instead.")
+            checked_handles.append(result["handle"])
+        else:
+            checked_handles.append(result["handle"])
+    handles = checked_handles
     
-    # Add new handles
-    new_handles = [h for h in handles if h not in existing_handles]
+    # Handles already in the file (in any casing) are skipped
+    new_handles = handle_registry.add_handles(HANDLES_FILE, handles, args.group)
     
     if not new_handles:
         print("All handles already exist in the file. No changes made.")
         return
     
-    # Append new handles to the file
-    with open(HANDLES_FILE, "a") as f:
-        for handle in new_handles:
-            f.write(f"{handle}\n")
-    
     print(f"Added {len(new_handles)} new handles to {HANDLES_FILE}.")
-    print(f"Total handles in file: {len(existing_handles) + len(new_handles)}")
+    print(f"Total handles in file: {len(handle_registry.load_index(HANDLES_FILE))}")
 
 if __name__ == "__main__":
     add_handles() 
\ No newline at end of file
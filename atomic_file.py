@@ -0,0 +1,124 @@
+"""
+Crash-safe file writes.
+
+Files are written to a temporary file in the same directory, flushed and
+fsynced, and then renamed over the target, so a process that is killed
+mid-write leaves either the old file or the new one, never a truncated one.
+Optionally, the previous versions are kept as numbered backups
+(user_data.json.1, user_data.json.2, ...).
+
+Long-running exports write to a "<name>.partial" file instead, which can be
+resumed after a crash and is moved into place once it is complete.
+"""
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Number of previous versions to keep next to each file (0 keeps none)
+BACKUP_COUNT = int(os.getenv("CF_BACKUP_COUNT", "0"))
+
+def read_umask():
+    """Return the process umask, which can only be read by setting it."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+# Read once at import time: while it is briefly set to 0, files created by
+# other threads would get world-writable permissions
+UMASK = read_umask()
+
+def backup_path(path, number):
+    """Return the path of a numbered backup of a file."""
+    return f"{path}.{number}"
+
+def backup_paths(path):
+    """Return the existing backups of a file, newest first."""
+    paths = []
+    number = 1
+    while os.path.exists(backup_path(path, number)):
+        paths.append(backup_path(path, number))
+        number += 1
+    return paths
+
+def rotate_backups(path, count):
+    """Shift existing backups up by one and make the current file backup number 1."""
+    if count <= 0 or not os.path.exists(path):
+        return
+
+    for number in range(count - 1, 0, -1):
+        if os.path.exists(backup_path(path, number)):
+            os.replace(backup_path(path, number), backup_path(path, number + 1))
+
+    newest = backup_path(path, 1)
+    if os.path.exists(newest):
+        os.remove(newest)
+    try:
+        # A hard link keeps the current file in place until it is replaced
+        os.link(path, newest)
+    except OSError:
+        shutil.copy2(path, newest)
+
+def fsync_directory(directory):
+    """Flush a directory entry so a completed rename survives a power loss."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return  # Not supported on Windows
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+@contextmanager
+def atomic_write(path, mode="w", newline=None, backups=None):
+    """Open a file for writing so that it is replaced atomically when the block exits.
+
+    If the block raises, the target file is left untouched. backups defaults to
+    CF_BACKUP_COUNT.
+    """
+    if backups is None:
+        backups = BACKUP_COUNT
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+
+    try:
+        with os.fdopen(fd, mode, newline=newline) as f:
+            # mkstemp creates the file as 0600; keep the permissions of the file we replace
+            if os.path.exists(path):
+                shutil.copymode(path, temp_path)
+            else:
+                os.chmod(temp_path, 0o666 & ~UMASK)
+
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+
+        rotate_backups(path, backups)
+        os.replace(temp_path, path)
+        fsync_directory(directory)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def partial_path(path):
+    """Return the path of the in-progress version of a streamed file."""
+    return f"{path}.partial"
+
+def finish_partial(path, backups=None):
+    """Atomically move a completed partial file over its final path."""
+    if backups is None:
+        backups = BACKUP_COUNT
+    temp_path = partial_path(path)
+
+    with open(temp_path, "rb+") as f:
+        os.fsync(f.fileno())
+
+    rotate_backups(path, backups)
+    os.replace(temp_path, path)
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Benchmark the fetch, diff and export pipeline on synthetic rosters.
+
+For each roster size, a scratch directory is filled with a synthetic
+handles.txt and every stage runs against mock_api_server.py with synthetic
+data, so no network access or API quota is needed. The mock server runs in a
+separate process so that its work is not counted. Each stage is timed and
+its peak Python memory measured with tracemalloc. Results are printed as a
+table and saved as JSON, so runs can be compared across releases.
+
+    python3 benchmark.py
+    python3 benchmark.py --sizes 100 1000 --output results.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+import subprocess
+from datetime import datetime
+from tabulate import tabulate
+import cf_api
+import atomic_file
+import tracking_store
+import handle_registry
+import rating_cache
+import contest_ingest
+import snapshots
+import cf_tracker
+import historical_ranks
+import export_csv
+import export_historical_csv
+import mock_api_server
+
+# Constants
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+OUTPUT_FILE = "benchmark_results.json"
+# Share of handles whose rating changed between the two snapshots compared
+CHANGED_SHARE = 0.2
+# Contests in each locally generated rating history
+MAX_HISTORY_LENGTH = 60
+# Seconds to wait for the mock server to start accepting connections
+SERVER_START_TIMEOUT = 10
+STAGES = [
+    "load_handles", "load_handles_indexed", "get_user_info", "compare_data", "record_poll",
+    "export_csv", "historical_ratings", "export_historical_csv"
+]
+# Stages whose results a stage needs
+DEPENDENCIES = {
+    "load_handles_indexed": ["load_handles"],
+    "get_user_info": ["load_handles"],
+    "compare_data": ["get_user_info"],
+    "record_poll": ["get_user_info"],
+    "export_csv": ["record_poll"],
+    "historical_ratings": ["load_handles"]
+}
+
+def required_stages(stages):
+    """Return the selected stages plus every stage they depend on."""
+    required = set()
+    todo = list(stages)
+    while todo:
+        stage = todo.pop()
+        if stage not in required:
+            required.add(stage)
+            todo.extend(DEPENDENCIES.get(stage, []))
+    return required
+
+def start_mock_server(roster_size):
+    """Start mock_api_server.py with synthetic data in a subprocess. Returns (process, port)."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_api_server.py")
+    process = subprocess.Popen(
+        [sys.executable, script, "--port", str(port), "--synthetic", "--roster-size", str(roster_size)],
+        stdout=subprocess.DEVNULL
+    )
+
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, port
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("The mock API server did not start.")
+            time.sleep(0.1)
+
+def point_modules_at(directory, base_url):
+    """Make every module read and write its files in the scratch directory and call the mock API."""
+    cf_api.API_BASE_URL = base_url
+    cf_api.RECORD_DIR = None
+    cf_api.rate_limiter.rate = 0
+    atomic_file.BACKUP_COUNT = 0
+
+    handles_file = os.path.join(directory, "handles.txt")
+    cf_tracker.HANDLES_FILE = handles_file
+    cf_tracker.USER_DATA_FILE = os.path.join(directory, "user_data.json")
+    historical_ranks.HANDLES_FILE = handles_file
+    historical_ranks.LEGACY_HANDLES_FILE = os.path.join(directory, "private_handles.txt")
+    tracking_store.TRACKING_DB_FILE = os.path.join(directory, "tracking.db")
+    handle_registry.REGISTRY_DB_FILE = os.path.join(directory, "handles.db")
+    rating_cache.RATING_CACHE_FILE = os.path.join(directory, "rating_cache.json")
+    contest_ingest.INGEST_DB_FILE = os.path.join(directory, "contest_ingest.db")
+    export_csv.HANDLES_FILE = handles_file
+    export_csv.USER_DATA_FILE = cf_tracker.USER_DATA_FILE
+    export_csv.CSV_OUTPUT_FILE = os.path.join(directory, "codeforces_ranks.csv")
+    export_historical_csv.OUTPUT_FILE = os.path.join(directory, "historical_codeforces_ranks.csv")
+
+def write_roster(path, size):
+    """Write a synthetic handles.txt with the given number of handles."""
+    with open(path, "w") as f:
+        f.write("# Synthetic benchmark roster\n")
+        for number in range(size):
+            f.write(f"{mock_api_server.synthetic_handle(number)}\n")
+
+def perturb(data, rnd):
+    """Return a copy of a snapshot in which a share of the handles had a different rating."""
+    previous = {}
+    for handle, record in data.items():
+        record = dict(record)
+        if rnd.random() < CHANGED_SHARE:
+            record["rating"] = record["rating"] - rnd.randint(-100, 100)
+        previous[handle] = record
+    return previous
+
+def make_histories(handles, rnd):
+    """Generate a rating history for each handle, without going through the API."""
+    histories = {}
+    for handle in handles:
+        timestamp = mock_api_server.SYNTHETIC_START
+        rating = 1500
+        history = []
+        for contest_id in range(rnd.randint(0, MAX_HISTORY_LENGTH)):
+            timestamp += rnd.randint(7, 60) * 86400
+            new_rating = max(0, rating + rnd.randint(-120, 120))
+            history.append({
+                "contestId": contest_id,
+                "handle": handle,
+                "ratingUpdateTimeSeconds": timestamp,
+                "oldRating": rating,
+                "newRating": new_rating
+            })
+            rating = new_rating
+        histories[handle] = history
+    return histories
+
+def run_stage(name, size, function, measure_memory):
+    """Run one stage with its output suppressed and return its measurements.
+
+    function returns the number of items it processed.
+    """
+    if measure_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        items = function()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+    if measure_memory:
+        tracemalloc.stop()
+
+    return {
+        "size": size,
+        "stage": name,
+        "seconds": round(seconds, 4),
+        "items": items,
+        "items_per_second": round(items / seconds, 1) if seconds > 0 else None,
+        "peak_memory_mb": round(peak / 2 ** 20, 2) if peak is not None else None
+    }
+
+def benchmark_size(size, stages, measure_memory):
+    """Run the selected stages on a synthetic roster of the given size."""
+    rnd = random.Random(size)
+    server, port = start_mock_server(size)
+    results = []
+    state = {}
+
+    def load_handles():
+        state["handles"] = cf_tracker.load_handles()
+        return len(state["handles"])
+
+    def get_user_info():
+        state["current"] = cf_tracker.get_user_info(state["handles"])
+        return len(state["current"])
+
+    def compare_data():
+        return len(cf_tracker.compare_data(state["current"], state["previous"]))
+
+    def record_poll():
+        tracking_store.record_poll(state["current"])
+        cf_tracker.save_user_data(state["current"])
+        return len(state["current"])
+
+    def export():
+        export_csv.export_to_csv()
+        return len(state["current"])
+
+    def historical_ratings():
+        years = snapshots.DEFAULT_YEARS
+        for handle, history in state["histories"].items():
+            historical_ranks.get_historical_ratings(handle, years, history)
+        return len(state["histories"])
+
+    def export_historical():
+        sys.argv = ["export_historical_csv.py", "--fetch", "contests", "--restart"]
+        export_historical_csv.main()
+        return len(historical_ranks.load_handles())
+
+    functions = {
+        "load_handles": load_handles,
+        "load_handles_indexed": load_handles,
+        "get_user_info": get_user_info,
+        "compare_data": compare_data,
+        "record_poll": record_poll,
+        "export_csv": export,
+        "historical_ratings": historical_ratings,
+        "export_historical_csv": export_historical
+    }
+
+    original_argv = sys.argv
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="cf-benchmark-") as directory:
+        try:
+            os.chdir(directory)
+            point_modules_at(directory, f"http://127.0.0.1:{port}/api")
+            write_roster(cf_tracker.HANDLES_FILE, size)
+
+            # Stages that are not reported still run if a reported one needs their data
+            required = required_stages(stages)
+            for stage in STAGES:
+                if stage not in required:
+                    continue
+                if stage == "compare_data" and "current" in state:
+                    state["previous"] = perturb(state["current"], rnd)
+                if stage == "historical_ratings":
+                    state["histories"] = make_histories(state.get("handles", []), rnd)
+
+                result = run_stage(stage, size, functions[stage], measure_memory and stage in stages)
+                if stage in stages:
+                    results.append(result)
+                    print(f"  {stage}: {result['seconds']:.3f}s")
+        finally:
+            os.chdir(original_cwd)
+            sys.argv = original_argv
+            server.terminate()
+            server.wait()
+
+    return results
+
+def git_commit():
+    """Return the current git commit of the repository, if it can be determined."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark the fetch, diff and export pipeline on synthetic rosters.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="roster sizes to benchmark (default: %(default)s)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="stages to report (default: all)")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="do not measure peak memory (tracemalloc slows every stage down)")
+    parser.add_argument("-o", "--output", default=OUTPUT_FILE, help="JSON file to save results to (default: %(default)s)")
+    return parser.parse_args()
+
+def main():
+    """Main function."""
+    args = parse_args()
+    results = []
+    for size in args.sizes:
+        print(f"Benchmarking a roster of {size} handles...")
+        results.extend(benchmark_size(size, args.stages, not args.no_memory))
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "memory_measured": not args.no_memory,
+        "results": results
+    }
+    with atomic_file.atomic_write(args.output) as f:
+        json.dump(report, f, indent=2)
+
+    table = [
+        [r["size"], r["stage"], f"{r['seconds']:.3f}", r["items_per_second"], r["peak_memory_mb"]]
+        for r in results
+    ]
+    print()
+    print(tabulate(table, headers=["Handles", "Stage", "Seconds", "Items/s", "Peak MB"], tablefmt="pretty"))
+    print(f"\nResults saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
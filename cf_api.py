@@ -0,0 +1,519 @@
+"""
+Shared Codeforces API client used by all the scripts.
+
+All requests go through a single keep-alive requests.Session so that the TLS
+connection to codeforces.com is reused instead of being re-established for
+every call. Transient failures (timeouts, HTTP 429/5xx, "Call limit exceeded")
+are retried with exponential backoff, and a circuit breaker stops the run with
+APIUnavailableError when codeforces.com keeps failing. Every call is counted
+in metrics (outcome, bytes, latency, rate-limit and retry waits).
+
+Set CF_API_BASE_URL to talk to another endpoint (such as mock_api_server.py),
+and CF_RECORD_DIR to save every raw response there for replaying later.
+"""
+
+import os
+import re
+import time
+import json
+import hashlib
+import random
+import threading
+import email.utils
+import urllib.parse
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from atomic_file import atomic_write
+import metrics
+
+# Load environment variables
+load_dotenv()
+
+# Constants
+API_BASE_URL = os.getenv("CF_API_BASE_URL", "https://codeforces.com/api").rstrip("/")
+API_KEY = os.getenv("CODEFORCES_API_KEY")
+API_SECRET = os.getenv("CODEFORCES_SECRET")
+
+# Connection pool and timeout settings (seconds)
+POOL_SIZE = int(os.getenv("CF_POOL_SIZE", "10"))
+CONNECT_TIMEOUT = float(os.getenv("CF_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("CF_READ_TIMEOUT", "60"))
+
+# Longest request URL we send, measured after encoding and signing
+MAX_URL_BYTES = int(os.getenv("CF_MAX_URL_BYTES", "4000"))
+# Hard limit on handles per user.info call documented by Codeforces
+MAX_HANDLES_PER_CALL = 10000
+# e.g. "handles: User with handle foo not found"
+NOT_FOUND_PATTERN = re.compile(r"handle (\S+) not found", re.IGNORECASE)
+
+# Codeforces allows about one call every two seconds; 0 disables pacing
+RATE_LIMIT = float(os.getenv("CF_RATE_LIMIT", "0.5"))  # calls per second
+RATE_BURST = int(os.getenv("CF_RATE_BURST", "1"))
+
+# Directory in which raw responses are recorded (unset disables recording)
+RECORD_DIR = os.getenv("CF_RECORD_DIR")
+# Parameters that differ between otherwise identical calls and are left out of fixture names
+AUTH_PARAMS = {"apiKey", "time", "apiSig"}
+
+# Retries of a single call, and of all calls in the run together
+MAX_RETRIES = int(os.getenv("CF_MAX_RETRIES", "4"))
+RETRY_BUDGET = int(os.getenv("CF_RETRY_BUDGET", "50"))
+# Backoff before retry n is about RETRY_BASE_DELAY * 2**n seconds, capped and jittered
+RETRY_BASE_DELAY = float(os.getenv("CF_RETRY_BASE_DELAY", "2"))
+RETRY_MAX_DELAY = float(os.getenv("CF_RETRY_MAX_DELAY", "60"))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+CALL_LIMIT_COMMENT = "call limit exceeded"
+# Consecutive calls that fail even after retrying before all calls are refused
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("CF_CIRCUIT_BREAKER_THRESHOLD", "3"))
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv("CF_CIRCUIT_BREAKER_COOLDOWN", "300"))
+
+class APIUnavailableError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open.
+
+    Deliberately not a RequestException, so the per-handle fallbacks that catch
+    those let it through and the run stops.
+    """
+
+class RateLimiter:
+    """Token bucket that paces API calls across the whole process.
+
+    Tokens accumulate while requests are in flight or the caller is busy, so
+    time already spent is deducted from the next wait instead of added to it.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until it is available. Returns seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve the token now so concurrent callers queue up behind it
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+rate_limiter = RateLimiter(RATE_LIMIT, RATE_BURST)
+
+class RetryBudget:
+    """Caps the total number of retries made in one run.
+
+    Long-running callers (the watcher) call reset() at the start of each unit
+    of work, so retries spent weeks ago do not count against it.
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.remaining = total
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """Make the whole budget available again."""
+        with self.lock:
+            self.remaining = self.total
+
+    def take(self):
+        """Use up one retry. Returns False if the budget is exhausted."""
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+retry_budget = RetryBudget(RETRY_BUDGET)
+
+class CircuitBreaker:
+    """Refuses calls after too many consecutive failures, until a cooldown has passed.
+
+    After the cooldown one call is let through; if it succeeds the breaker
+    closes again, otherwise it stays open for another cooldown.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def check(self):
+        """Raise APIUnavailableError if calls are currently refused."""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown:
+                raise APIUnavailableError(
+                    f"Codeforces API unavailable after {self.failures} consecutive failed calls; giving up."
+                )
+            # Let one trial call through
+            self.opened_at = None
+            self.failures = self.threshold - 1
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.threshold > 0 and self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+circuit_breaker = CircuitBreaker(CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN)
+
+_session = None
+
+def get_session():
+    """Return the shared keep-alive session, creating it on first use."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+def build_url(method_name, params=None):
+    """Create an unauthenticated URL for a Codeforces API method."""
+    query_params = "&".join([f"{k}={urllib.parse.quote(str(v), safe='')}" for k, v in (params or {}).items()])
+    return f"{API_BASE_URL}/{method_name}?{query_params}"
+
+def create_authenticated_url(method_name, params=None):
+    """Create a URL for a Codeforces API method, signed if credentials are set.
+
+    Parameter values must be passed raw (not URL-encoded); they are signed as-is
+    and encoded when the final URL is built.
+    """
+    params = {k: str(v) for k, v in (params or {}).items()}
+
+    if not API_KEY or not API_SECRET:
+        # If API credentials are not available, return a non-authenticated URL
+        return build_url(method_name, params)
+
+    # Add authentication parameters
+    params["apiKey"] = API_KEY
+    params["time"] = str(int(time.time()))
+
+    # Generate random string for additional security
+    rand = str(random.randint(100000, 999999))
+
+    # Create signature string
+    # Note: We use the raw (unencoded) values for the signature
+    param_strings = [f"{k}={v}" for k, v in sorted(params.items())]
+    signature_string = f"{rand}/{method_name}?{'&'.join(param_strings)}#{API_SECRET}"
+
+    # Calculate SHA512 hash
+    signature = hashlib.sha512(signature_string.encode()).hexdigest()
+
+    # Build the final URL with URL-encoded parameter values
+    query_params = "&".join([f"{k}={urllib.parse.quote(v, safe='')}" for k, v in params.items()])
+    return f"{API_BASE_URL}/{method_name}?{query_params}&apiSig={rand}{signature}"
+
+def fixture_name(method_name, params=None):
+    """Return the file name under which the response to a call is recorded.
+
+    Authentication parameters are ignored, so signed and unsigned calls with
+    the same arguments share a fixture.
+    """
+    key = json.dumps(
+        sorted((k, str(v)) for k, v in (params or {}).items() if k not in AUTH_PARAMS),
+        separators=(",", ":")
+    )
+    return f"{method_name}-{hashlib.sha1(key.encode()).hexdigest()[:16]}.json"
+
+def record_response(method_name, params, response):
+    """Save a raw response in RECORD_DIR so mock_api_server.py can replay it."""
+    os.makedirs(RECORD_DIR, exist_ok=True)
+    fixture = {
+        "method": method_name,
+        "params": {k: str(v) for k, v in (params or {}).items() if k not in AUTH_PARAMS},
+        "status": response.status_code,
+        "body": response.text
+    }
+    with atomic_write(os.path.join(RECORD_DIR, fixture_name(method_name, params)), backups=0) as f:
+        json.dump(fixture, f)
+
+def is_transient(response):
+    """Check whether a response reports a temporary failure worth retrying."""
+    if response.status_code in RETRY_STATUS_CODES:
+        return True
+    if response.status_code == 200:
+        return False
+    try:
+        comment = response.json().get("comment") or ""
+    except ValueError:
+        return False
+    return CALL_LIMIT_COMMENT in comment.lower()
+
+def retry_delay(attempt, response=None):
+    """Return how long to wait before retry number attempt (0-based).
+
+    A Retry-After header (seconds or an HTTP date) takes precedence; otherwise
+    the delay doubles with each attempt, with random jitter so that concurrent
+    callers do not retry in lockstep.
+    """
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), RETRY_MAX_DELAY)
+        except ValueError:
+            try:
+                when = email.utils.parsedate_to_datetime(retry_after)
+                return min(max(when.timestamp() - time.time(), 0), RETRY_MAX_DELAY)
+            except (TypeError, ValueError):
+                pass
+
+    delay = min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def decode(method_name, response):
+    """Decode a response as JSON, counting the time spent in metrics."""
+    start = time.perf_counter()
+    try:
+        return response.json()
+    finally:
+        metrics.inc("cf_api_decode_seconds_total", time.perf_counter() - start, method=method_name)
+
+def request(method_name, params=None, authenticated=True):
+    """Call a Codeforces API method over the shared session and return the response.
+
+    Timeouts, connection errors and transient responses (HTTP 429/5xx, "Call
+    limit exceeded") are retried with backoff, up to MAX_RETRIES times per
+    call and RETRY_BUDGET times per run. A run is the whole process for the
+    one-shot scripts; cf_tracker resets retry_budget before each run and each
+    wake-up of the watcher, so a long-lived watcher never exhausts it.
+
+    Errors that remain are raised as requests.exceptions.RequestException or
+    returned as the final response; other HTTP status handling is left to the
+    caller. Raises APIUnavailableError while the circuit breaker is open.
+    """
+    try:
+        circuit_breaker.check()
+    except APIUnavailableError:
+        metrics.inc("cf_api_calls_total", method=method_name, outcome="refused")
+        raise
+
+    attempt = 0
+    while True:
+        # Wait for our turn before signing so the signature timestamp is current
+        waited = rate_limiter.acquire()
+        metrics.inc("cf_api_rate_limit_wait_seconds_total", waited, method=method_name)
+        if authenticated:
+            url = create_authenticated_url(method_name, params)
+        else:
+            url = build_url(method_name, params)
+
+        response = None
+        start = time.perf_counter()
+        try:
+            response = get_session().get(url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
+            outcome = "timeout" if isinstance(e, requests.exceptions.Timeout) else "connection_error"
+            metrics.inc("cf_api_calls_total", method=method_name, outcome=outcome)
+        else:
+            transient = is_transient(response)
+            outcome = "transient" if transient else "ok" if response.status_code == 200 else "http_error"
+            metrics.inc("cf_api_calls_total", method=method_name, outcome=outcome)
+            metrics.inc("cf_api_response_bytes_total", len(response.content), method=method_name, outcome=outcome)
+            if not transient:
+                circuit_breaker.record_success()
+                if RECORD_DIR:
+                    record_response(method_name, params, response)
+                return response
+            error = None
+        finally:
+            metrics.observe("cf_api_latency_seconds", time.perf_counter() - start, method=method_name)
+
+        if attempt >= MAX_RETRIES or not retry_budget.take():
+            circuit_breaker.record_failure()
+            if error is not None:
+                raise error
+            return response
+
+        delay = retry_delay(attempt, response)
+        reason = error if error is not None else f"HTTP {response.status_code}"
+        print(f"{method_name} failed ({reason}). Retrying in {delay:.1f}s...")
+        metrics.inc("cf_api_retry_wait_seconds_total", delay, method=method_name)
+        time.sleep(delay)
+        attempt += 1
+
+def get_result(method_name, params=None, on_error=None):
+    """Call a Codeforces API method and return its "result", or None on failure.
+
+    If the API never answered (connection errors, or transient failures that
+    outlasted the retries), on_error is returned instead, so callers can tell
+    a failed request from a FAILED answer.
+    """
+    try:
+        response = request(method_name, params)
+        if is_transient(response):
+            print(f"Request Error ({method_name}): HTTP {response.status_code} after retrying")
+            return on_error
+        data = decode(method_name, response)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Request Error ({method_name}): {e}")
+        return on_error
+
+    if data.get("status") != "OK":
+        print(f"API Error ({method_name}): {data.get('comment', 'Unknown error')}")
+        return None
+    return data["result"]
+
+def next_handle_chunk(handles, start, max_url_bytes):
+    """Return the end index of the largest chunk starting at start that fits in a user.info URL."""
+    # Length of a signed URL without handles, plus one encoded ";" per extra handle
+    url_bytes = len(create_authenticated_url("user.info", {"handles": ""}))
+    separator_bytes = len(urllib.parse.quote(";", safe=""))
+
+    end = start
+    while end < len(handles) and end - start < MAX_HANDLES_PER_CALL:
+        handle_bytes = len(urllib.parse.quote(handles[end], safe=""))
+        if end > start:
+            handle_bytes += separator_bytes
+        if end > start and url_bytes + handle_bytes > max_url_bytes:
+            break
+        url_bytes += handle_bytes
+        end += 1
+    return end
+
+def is_url_too_long(response):
+    """Check whether a response rejects the request because its URL was too long."""
+    if response.status_code == 414:
+        return True
+    if response.status_code == 400:
+        # Codeforces reports invalid handles as a 400 with a JSON comment;
+        # a 400 without one comes from the front-end server rejecting the request line
+        try:
+            return response.json().get("status") != "FAILED"
+        except ValueError:
+            return True
+    return False
+
+def match_users(chunk, users):
+    """Map each requested handle in chunk to the user object returned for it."""
+    if len(users) == len(chunk):
+        # Results come back in request order
+        return dict(zip(chunk, users))
+    by_key = {user["handle"].lower(): user for user in users}
+    return {handle: by_key[handle.lower()] for handle in chunk if handle.lower() in by_key}
+
+def find_not_found_handle(comment, chunk):
+    """Return the handle from chunk named in a "handle X not found" API comment, if any."""
+    match = NOT_FOUND_PATTERN.search(comment or "")
+    if not match:
+        return None
+
+    name = match.group(1).lower()
+    for handle in chunk:
+        if handle.lower() == name:
+            return handle
+    return None
+
+def request_user_info_chunk(chunk):
+    """Request user.info for a chunk. Returns the decoded response, or None on a request error."""
+    try:
+        return decode("user.info", request("user.info", {"handles": ";".join(chunk)}))
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Request Error: {e}")
+        return None
+
+def resolve_chunk(chunk, data, users, invalid):
+    """Record the result of a user.info chunk, recovering from failures.
+
+    A handle named in a "not found" comment is removed and the rest retried in
+    one request; any other failure splits the chunk in half and retries each
+    half, so a bad handle among n costs about log2(n) extra requests.
+    """
+    while chunk:
+        if data and data.get("status") == "OK":
+            users.update(match_users(chunk, data["result"]))
+            return
+
+        comment = data.get("comment", "") if data else ""
+        missing = find_not_found_handle(comment, chunk)
+
+        if CALL_LIMIT_COMMENT in comment.lower():
+            # Still rate limited after retrying; splitting the chunk would only make it worse
+            print(f"  ✗ Failed to fetch data for {len(chunk)} handles: {comment}")
+            return
+        elif missing:
+            invalid.append(missing)
+            chunk = [handle for handle in chunk if handle != missing]
+        elif len(chunk) == 1:
+            if "not found" in comment:
+                invalid.append(chunk[0])
+            else:
+                print(f"  ✗ Failed to fetch data for {chunk[0]}: {comment or 'request error'}")
+            return
+        else:
+            middle = len(chunk) // 2
+            for half in (chunk[:middle], chunk[middle:]):
+                resolve_chunk(half, request_user_info_chunk(half), users, invalid)
+            return
+
+        if chunk:
+            data = request_user_info_chunk(chunk)
+
+def fetch_user_info(handles):
+    """Fetch user.info for many handles in as few requests as the URL limit allows.
+
+    Chunks are packed up to MAX_URL_BYTES and shrunk automatically if the server
+    rejects a URL as too long. Returns (users, invalid) where users maps each
+    requested handle to its user object and invalid lists the handles Codeforces
+    reported as not found. Handles in neither could not be fetched.
+    """
+    users = {}
+    invalid = []
+    for chunk_users, chunk_invalid in iter_user_info(handles):
+        users.update(chunk_users)
+        invalid.extend(chunk_invalid)
+    return users, invalid
+
+def iter_user_info(handles):
+    """Like fetch_user_info, but yields (users, invalid) for each chunk as soon as it is resolved."""
+    max_url_bytes = MAX_URL_BYTES
+
+    print(f"Processing {len(handles)} handles in chunks of up to {max_url_bytes} URL bytes...")
+
+    start = 0
+    while start < len(handles):
+        end = next_handle_chunk(handles, start, max_url_bytes)
+        chunk = handles[start:end]
+
+        print(f"Processing handles {start+1}-{end} of {len(handles)}...")
+
+        try:
+            response = request("user.info", {"handles": ";".join(chunk)})
+
+            if len(chunk) > 1 and is_url_too_long(response):
+                max_url_bytes //= 2
+                print(f"Request URL too long (HTTP {response.status_code}). Retrying with chunks of up to {max_url_bytes} URL bytes...")
+                continue
+
+            data = decode("user.info", response)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Request Error: {e}")
+            data = None
+
+        if not data or data.get("status") != "OK":
+            print(f"Failed to process handles as a group: {data.get('comment', 'Unknown error') if data else 'request error'}. Narrowing down...")
+
+        users = {}
+        invalid = []
+        resolve_chunk(chunk, data, users, invalid)
+        yield users, invalid
+        start = end
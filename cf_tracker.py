@@ -4,25 +4,36 @@ Codeforces Rank Tracker - Track changes in Codeforces ranks for a list of handle
 """
 
 import os
+import sys
+import csv
 import json
 import time
-import requests
-import hashlib
-import random
-import urllib.parse  # Add this import for URL encoding
+import argparse
+import contextlib
 from datetime import datetime
 from tabulate import tabulate
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+import cf_api
+import changes
+import handle_registry
+import metrics
+import ranks
+import rating_cache
+import tracking_store
+from atomic_file import atomic_write, backup_paths
 
 # Constants
-API_BASE_URL = "https://codeforces.com/api"
 HANDLES_FILE = "handles.txt"
 USER_DATA_FILE = "user_data.json"
-API_KEY = os.getenv("CODEFORCES_API_KEY")
-API_SECRET = os.getenv("CODEFORCES_SECRET")
+# Watch mode: first delay before re-checking a finished contest for rating
+# changes (doubled after each miss), and the longest wait between schedule reads
+WATCH_POLL_INTERVAL = 600
+WATCH_MAX_POLL_INTERVAL = 6 * 3600
+WATCH_SCHEDULE_INTERVAL = 86400
+# Output formats for the results; only "table" is meant for people
+OUTPUT_FORMATS = ["table", "json", "ndjson", "csv"]
+# Formats that can be written as a stream of separate outputs, one per watched contest
+WATCH_FORMATS = ["table", "ndjson"]
+RESULT_FIELDS = ["handle", "rating", "change", "rank", "rank_direction", "new", "max_rating", "max_rank", "last_updated"]
 COLORS = {
     "green": "\033[92m",
     "red": "\033[91m",
@@ -35,257 +46,248 @@ COLORS = {
     "gray": "\033[90m"
 }
 
-def load_handles():
-    """Load Codeforces handles from the handles file."""
+def load_handles(group=None):
+    """Load Codeforces handles from the handles file (optionally only one group)."""
     if not os.path.exists(HANDLES_FILE):
         print(f"Error: {HANDLES_FILE} not found. Creating an empty file.")
         with open(HANDLES_FILE, "w") as f:
             f.write("# Add your students' Codeforces handles below (one per line)\n")
         return []
     
-    handles = []
-    with open(HANDLES_FILE, "r") as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith("#"):
-                handles.append(line)
-    
-    return handles
+    # The registry only re-reads the file when it has changed
+    return handle_registry.load_handles(HANDLES_FILE, group)
 
 def load_previous_data():
-    """Load previously stored user data."""
+    """Load previously stored user data, falling back to backups if it is corrupted."""
     if not os.path.exists(USER_DATA_FILE):
         return {}
     
-    try:
-        with open(USER_DATA_FILE, "r") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        print(f"Error: {USER_DATA_FILE} is corrupted. Creating a new one.")
-        return {}
+    for path in [USER_DATA_FILE] + backup_paths(USER_DATA_FILE):
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if path != USER_DATA_FILE:
+                print(f"Recovered previous data from backup {path}.")
+            return data
+        except json.JSONDecodeError:
+            print(f"Error: {path} is corrupted.")
+    
+    print(f"No usable copy of {USER_DATA_FILE} found. Creating a new one.")
+    return {}
 
 def save_user_data(data):
-    """Save user data to the JSON file."""
-    with open(USER_DATA_FILE, "w") as f:
+    """Save user data to the JSON file, replacing it atomically."""
+    with atomic_write(USER_DATA_FILE) as f:
         json.dump(data, f, indent=2)
 
-def get_user_info(handles):
-    """Fetch user information from Codeforces API."""
-    if not handles:
-        return {}
-    
-    # Reduce chunk size to avoid URL length limitations
-    # Codeforces API has limitations on URL length
-    chunk_size = 20  # Reduced from 100 to 20
-    all_user_info = {}
-    
-    print(f"Processing {len(handles)} handles in chunks of {chunk_size}...")
+def update_user_data(data, handles):
+    """Replace the records of the given handles in user_data.json, keeping everyone else's."""
+    keys = {handle.lower() for handle in handles}
+    merged = {handle: record for handle, record in load_previous_data().items() if handle.lower() not in keys}
+    merged.update(data)
+    save_user_data(merged)
+
+def build_user_record(user):
+    """Build the stored record for a user object returned by user.info."""
+    handle = user["handle"]
+    max_rank = user.get("maxRank", "unrated")
     
-    for i in range(0, len(handles), chunk_size):
-        chunk = handles[i:i+chunk_size]
-        # URL encode each handle to handle special characters
-        encoded_handles = [urllib.parse.quote(handle) for handle in chunk]
-        handles_param = ";".join(encoded_handles)
-        
-        print(f"Processing handles {i+1}-{min(i+chunk_size, len(handles))} of {len(handles)}...")
+    # Fix for when maxRank is the same as handle (happens with tourist)
+    if max_rank == handle:
+        # Use the current rank or determine based on max rating
+        max_rank = user.get("rank", "unrated")
         
-        try:
-            # Basic request without authentication (works for most cases)
-            url = f"{API_BASE_URL}/user.info?handles={handles_param}"
-            
-            # If API key and secret are available, use authenticated request
-            if API_KEY and API_SECRET:
-                url = create_authenticated_url("user.info", {"handles": handles_param})
-            
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data["status"] == "OK":
-                for user in data["result"]:
-                    handle = user["handle"]
-                    max_rank = user.get("maxRank", "unrated")
-                    
-                    # Fix for when maxRank is the same as handle (happens with tourist)
-                    if max_rank == handle:
-                        # Use the current rank or determine based on max rating
-                        max_rank = user.get("rank", "unrated")
-                        
-                        # If max rating is higher than current rating, it's likely legendary grandmaster
-                        if user.get("maxRating", 0) >= 3000:
-                            max_rank = "legendary grandmaster"
-                    
-                    all_user_info[handle] = {
-                        "handle": handle,
-                        "rating": user.get("rating", 0),
-                        "rank": user.get("rank", "unrated"),
-                        "max_rating": user.get("maxRating", 0),
-                        "max_rank": max_rank,
-                        "last_updated": datetime.now().isoformat()
-                    }
-            else:
-                print(f"API Error: {data.get('comment', 'Unknown error')}")
-            
-            # Be nice to the API - increase delay between requests
-            time.sleep(2)  # Increased from 1 to 2 seconds
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Request Error: {e}")
-            print(f"Failed to process handles as a group. Trying individual requests...")
-            
-            # Try to fetch each handle individually
-            for handle in chunk:
-                try:
-                    # Try to get individual handle info
-                    encoded_handle = urllib.parse.quote(handle)
-                    individual_url = f"{API_BASE_URL}/user.info?handles={encoded_handle}"
-                    
-                    if API_KEY and API_SECRET:
-                        individual_url = create_authenticated_url("user.info", {"handles": encoded_handle})
-                    
-                    individual_response = requests.get(individual_url)
-                    individual_response.raise_for_status()
-                    individual_data = individual_response.json()
-                    
-                    if individual_data["status"] == "OK" and individual_data["result"]:
-                        user = individual_data["result"][0]
-                        handle = user["handle"]
-                        max_rank = user.get("maxRank", "unrated")
-                        
-                        # Fix for when maxRank is the same as handle
-                        if max_rank == handle:
-                            max_rank = user.get("rank", "unrated")
-                            if user.get("maxRating", 0) >= 3000:
-                                max_rank = "legendary grandmaster"
-                        
-                        all_user_info[handle] = {
-                            "handle": handle,
-                            "rating": user.get("rating", 0),
-                            "rank": user.get("rank", "unrated"),
-                            "max_rating": user.get("maxRating", 0),
-                            "max_rank": max_rank,
-                            "last_updated": datetime.now().isoformat()
-                        }
-                        print(f"  ✓ Successfully fetched data for {handle}")
-                    else:
-                        print(f"  ✗ Failed to fetch data for {handle}: {individual_data.get('comment', 'Unknown error')}")
-                    
-                    # Be extra nice to the API when doing individual requests
-                    time.sleep(1)
-                    
-                except requests.exceptions.RequestException as individual_error:
-                    print(f"  ✗ Error fetching data for {handle}: {individual_error}")
-                    time.sleep(1)
+        # If max rating is higher than current rating, it's likely legendary grandmaster
+        if user.get("maxRating", 0) >= 3000:
+            max_rank = "legendary grandmaster"
     
+    return {
+        "handle": handle,
+        "rating": user.get("rating", 0),
+        "rank": user.get("rank", "unrated"),
+        "max_rating": user.get("maxRating", 0),
+        "max_rank": max_rank,
+        "last_updated": datetime.now().isoformat()
+    }
+
+def get_user_info(handles):
+    """Fetch user information from Codeforces API."""
+    all_user_info = {}
+    for records in iter_user_info(handles):
+        all_user_info.update((record["handle"], record) for record in records.values())
     return all_user_info
 
-def create_authenticated_url(method_name, params=None):
-    """Create an authenticated URL for Codeforces API."""
-    if not API_KEY or not API_SECRET:
-        print("Warning: API key or secret not found. Using unauthenticated request.")
-        query_params = "&".join([f"{k}={v}" for k, v in (params or {}).items()])
-        return f"{API_BASE_URL}/{method_name}?{query_params}"
+def iter_user_info(handles):
+    """Fetch user information chunk by chunk.
+
+    Yields a dict of requested handle -> record as soon as each chunk is
+    resolved; records carry the canonical handle returned by the API. Renames
+    are applied once every chunk is in.
+    """
+    if not handles:
+        return
     
-    if params is None:
-        params = {}
+    # Chunks are sized to the URL length limit rather than a fixed handle count,
+    # and failed chunks are bisected instead of retried one handle at a time
+    users = {}
+    invalid_handles = []
+    for chunk_users, chunk_invalid in cf_api.iter_user_info(handles):
+        users.update(chunk_users)
+        invalid_handles.extend(chunk_invalid)
+        yield {requested: build_user_record(user) for requested, user in chunk_users.items()}
     
-    # Add authentication parameters
-    params["apiKey"] = API_KEY
-    params["time"] = str(int(time.time()))
+    resolve_renames(users, invalid_handles)
     
-    # Generate random string for additional security
-    rand = str(random.randint(100000, 999999))
+    for handle in invalid_handles:
+        print(f"  ✗ Handle not found on Codeforces: {handle}")
+
+def resolve_renames(users, invalid_handles):
+    """Switch renamed or re-cased handles to the canonical handle returned by the API.
+
+    users maps each requested handle to its user object. The roster and the
+    tracking store are rewritten in one batch, so the user keeps one identity
+    and later runs request the current handle directly.
+    """
+    handle_registry.record_validations(users, invalid_handles)
     
-    # Create signature string
-    # Note: We use the raw (unencoded) values for the signature
-    param_strings = []
-    for key in sorted(params.keys()):
-        param_strings.append(f"{key}={params[key]}")
+    renames = {requested: user["handle"] for requested, user in users.items() if requested != user["handle"]}
+    if not renames:
+        return
     
-    signature_string = f"{rand}/{method_name}?{'&'.join(param_strings)}#{API_SECRET}"
+    for old_handle, new_handle in renames.items():
+        if old_handle.lower() != new_handle.lower():
+            print(f"  ↪ {old_handle} has been renamed to {new_handle}")
     
-    # Calculate SHA512 hash
-    signature = hashlib.sha512(signature_string.encode()).hexdigest()
+    handle_registry.rename_handles(HANDLES_FILE, renames)
+    tracking_store.rename_handles(renames)
     
-    # Build the final URL with URL-encoded parameter values
-    encoded_params = {}
-    for key, value in params.items():
-        # Don't encode the apiKey and time parameters
-        if key in ["apiKey", "time"]:
-            encoded_params[key] = value
-        else:
-            # Only encode the value, not the key
-            encoded_params[key] = urllib.parse.quote(value)
+    # Keep user_data.json in step with the tracking store
+    previous_data = load_previous_data()
+    keys = {old_handle.lower(): new_handle for old_handle, new_handle in renames.items()}
+    if any(handle.lower() in keys and handle != keys[handle.lower()] for handle in previous_data):
+        save_user_data({keys.get(handle.lower(), handle): record for handle, record in previous_data.items()})
+
+def compare_data(current_data, previous_data, changed_only=False, color=True):
+    """Compare current and previous data to detect changes.
+
+    The comparison is done by changes.diff_snapshots; this renders its change
+    set as table rows (all handles, or only new and changed ones).
+    """
+    change_set = changes.diff_snapshots(current_data, previous_data)
+    return render_changes(current_data, change_set, changed_only, color)
+
+def change_rows(current_data, change_set, changed_only=False):
+    """Turn a change set from changes.diff_snapshots into plain result records.
+
+    Each record has the RESULT_FIELDS: change is the rating delta and
+    rank_direction is 1 up, -1 down or 0. Records are in data order; nothing
+    is formatted, so they can be serialized as they are.
+    """
+    changed = {change["handle"]: change for change in change_set["changed"]}
+    new = set(change_set["new"])
+    if changed_only:
+        handles = list(changed) + change_set["new"]
+    else:
+        handles = list(current_data)
     
-    query_params = "&".join([f"{k}={v}" for k, v in encoded_params.items()])
-    return f"{API_BASE_URL}/{method_name}?{query_params}&apiSig={rand}{signature}"
+    rows = []
+    for handle in handles:
+        current = current_data[handle]
+        change = changed.get(handle)
+        rows.append({
+            "handle": handle,
+            "rating": current.get("rating", 0),
+            "change": change["delta"] if change else 0,
+            "rank": current.get("rank", "unrated"),
+            "rank_direction": change["rank_direction"] if change else 0,
+            "new": handle in new,
+            "max_rating": current.get("max_rating", 0),
+            "max_rank": current.get("max_rank", "unrated"),
+            "last_updated": current.get("last_updated")
+        })
+    return rows
+
+def diff_rows(current_data, previous_data, changed_only=False):
+    """Compare two snapshots and return the result records (see change_rows)."""
+    return change_rows(current_data, changes.diff_snapshots(current_data, previous_data), changed_only)
+
+def render_changes(current_data, change_set, changed_only=False, color=True):
+    """Render a change set from changes.diff_snapshots as table rows."""
+    rows = change_rows(current_data, change_set, changed_only)
+    # Sort by rating (descending)
+    rows.sort(key=lambda x: x["rating"], reverse=True)
+    return table_rows(rows, color)
+
+def paint(text, color_name, color=True):
+    """Wrap text in a terminal color, if color is enabled."""
+    return f"{COLORS[color_name]}{text}{COLORS['reset']}" if color else text
 
-def compare_data(current_data, previous_data):
-    """Compare current and previous data to detect changes."""
+def table_rows(rows, color=True):
+    """Render result records as table rows, with terminal colors if color is set."""
     results = []
     
-    for handle, current in current_data.items():
-        previous = previous_data.get(handle, {})
-        
-        # Calculate changes
-        rating_change = current.get("rating", 0) - previous.get("rating", 0) if previous else 0
-        rank_changed = previous and current.get("rank") != previous.get("rank")
+    for row in rows:
+        rating_change = row["change"]
         
         # Format the change indicators
         if rating_change > 0:
-            rating_change_str = f"{COLORS['green']}+{rating_change}{COLORS['reset']}"
+            rating_change_str = paint(f"+{rating_change}", "green", color)
         elif rating_change < 0:
-            rating_change_str = f"{COLORS['red']}{rating_change}{COLORS['reset']}"
+            rating_change_str = paint(rating_change, "red", color)
         else:
             rating_change_str = "0"
         
         rank_indicator = ""
-        if rank_changed:
-            # Determine if the rank change is an improvement
-            rank_order = ["unrated", "newbie", "pupil", "specialist", "expert", "candidate master", 
-                         "master", "international master", "grandmaster", "international grandmaster", "legendary grandmaster"]
-            
-            current_rank_idx = rank_order.index(current.get("rank", "unrated")) if current.get("rank", "unrated") in rank_order else -1
-            previous_rank_idx = rank_order.index(previous.get("rank", "unrated")) if previous.get("rank", "unrated") in rank_order else -1
-            
-            if current_rank_idx > previous_rank_idx:
-                rank_indicator = f" {COLORS['green']}↑{COLORS['reset']}"
-            elif current_rank_idx < previous_rank_idx:
-                rank_indicator = f" {COLORS['red']}↓{COLORS['reset']}"
+        if row["rank_direction"] > 0:
+            rank_indicator = " " + paint("↑", "green", color)
+        elif row["rank_direction"] < 0:
+            rank_indicator = " " + paint("↓", "red", color)
         
         # Color the rank
-        rank_color = get_rank_color(current.get("rank", "unrated"))
-        colored_rank = f"{rank_color}{current.get('rank', 'unrated')}{COLORS['reset']}"
+        rank = row["rank"]
+        colored_rank = f"{ranks.rank_color(rank)}{rank}{COLORS['reset']}" if color else rank
         
         results.append({
-            "Handle": handle,
-            "Rating": current.get("rating", 0),
+            "Handle": row["handle"],
+            "Rating": row["rating"],
             "Change": rating_change_str,
             "Rank": colored_rank + rank_indicator,
-            "Max Rating": current.get("max_rating", 0),
-            "Last Updated": format_date(current.get("last_updated", ""))
+            "Max Rating": row["max_rating"],
+            "Last Updated": format_date(row["last_updated"] or "")
         })
     
-    # Sort by rating (descending)
-    results.sort(key=lambda x: x["Rating"], reverse=True)
     return results
 
-def get_rank_color(rank):
-    """Get the color code for a Codeforces rank."""
-    rank_colors = {
-        "newbie": COLORS["gray"],
-        "pupil": COLORS["green"],
-        "specialist": COLORS["cyan"],
-        "expert": COLORS["blue"],
-        "candidate master": COLORS["purple"],
-        "master": COLORS["yellow"],
-        "international master": COLORS["yellow"],
-        "grandmaster": COLORS["red"],
-        "international grandmaster": COLORS["red"],
-        "legendary grandmaster": COLORS["red"]
-    }
-    
-    return rank_colors.get(rank.lower(), COLORS["reset"])
+def write_results(rows, output_format="table", out=None):
+    """Write result records to out (default: stdout) in the given output format.
+
+    The table is sorted by rating and colored only when out is a terminal;
+    the other formats write the records as they are.
+    """
+    out = out or sys.stdout
+    if output_format == "table":
+        rows = sorted(rows, key=lambda x: x["rating"], reverse=True)
+        if rows:
+            print(tabulate(table_rows(rows, out.isatty()), headers="keys", tablefmt="pretty"), file=out)
+        else:
+            print("No changes since the last run.", file=out)
+    elif output_format == "json":
+        json.dump(rows, out, indent=2)
+        out.write("\n")
+    elif output_format == "ndjson":
+        write_ndjson(rows, out)
+    elif output_format == "csv":
+        writer = csv.DictWriter(out, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        raise ValueError(f"Unknown output format: {output_format}")
+
+def write_ndjson(rows, out):
+    """Write result records as JSON lines, flushing so consumers see them right away."""
+    for row in rows:
+        out.write(json.dumps(row) + "\n")
+    out.flush()
 
 def format_date(iso_date):
     """Format ISO date string to a more readable format."""
@@ -295,37 +297,269 @@ def format_date(iso_date):
     except (ValueError, TypeError):
         return "N/A"
 
-def main():
-    """Main function to run the Codeforces rank tracker."""
-    print(f"{COLORS['bold']}Codeforces Rank Tracker{COLORS['reset']}")
-    print("Loading handles...")
-    handles = load_handles()
-    
-    if not handles:
-        print(f"No handles found in {HANDLES_FILE}. Please add some handles and try again.")
-        return
-    
+def load_baseline(handles=None):
+    """Load the latest tracked data, seeding the store from user_data.json on first use.
+
+    With handles, only their records are returned.
+    """
+    if not tracking_store.exists():
+        tracking_store.import_snapshot(load_previous_data())
+    data = tracking_store.latest_snapshot()
+    if handles is None:
+        return data
+    keys = {handle.lower() for handle in handles}
+    return {handle: record for handle, record in data.items() if handle.lower() in keys}
+
+def run_once(handles, changed_only=False, group=None, output_format="table", out=None):
+    """Fetch every handle once, show what changed and save the results.
+
+    With a group, only its handles are compared and everyone else's data is
+    kept. Results are written to out (default: stdout) in output_format;
+    NDJSON results are written chunk by chunk as they arrive, the other
+    formats once every handle has been fetched.
+    """
     print(f"Found {len(handles)} handles. Fetching data from Codeforces API...")
+    cf_api.retry_budget.reset()
     
-    # Load previous data
-    previous_data = load_previous_data()
+    # Load previous data from the time-series store. It is matched on the
+    # requested handle, so renamed handles still find their old record
+    with metrics.stage("load"):
+        previous_data = load_baseline(handles if group else None)
+    previous_by_key = {handle.lower(): record for handle, record in previous_data.items()}
     
-    # Get current data
-    current_data = get_user_info(handles)
+    current_data = {}
+    results = []
+    chunks = iter_user_info(handles)
+    while True:
+        with metrics.stage("fetch"):
+            records = next(chunks, None)
+        if records is None:
+            break
+        
+        # Compare each chunk as soon as it arrives
+        with metrics.stage("compare"):
+            current = {record["handle"]: record for record in records.values()}
+            previous = {
+                record["handle"]: previous_by_key[requested.lower()]
+                for requested, record in records.items() if requested.lower() in previous_by_key
+            }
+            rows = diff_rows(current, previous, changed_only)
+            current_data.update(current)
+            if output_format == "ndjson":
+                write_ndjson(rows, out or sys.stdout)
+            else:
+                results.extend(rows)
     
     if not current_data:
         print("Failed to fetch data from Codeforces API. Please try again later.")
         return
     
-    # Compare and display results
-    results = compare_data(current_data, previous_data)
+    if output_format != "ndjson":
+        with metrics.stage("compare"):
+            if output_format == "table":
+                print("\nResults:")
+            write_results(results, output_format, out)
     
-    print("\nResults:")
-    print(tabulate(results, headers="keys", tablefmt="pretty"))
+    # Record this poll and save the latest snapshot for future comparison
+    with metrics.stage("save"):
+        tracking_store.record_poll(current_data)
+        if group:
+            update_user_data(current_data, handles + list(current_data))
+        else:
+            save_user_data(current_data)
+    print(f"\nData saved to {tracking_store.TRACKING_DB_FILE} and {USER_DATA_FILE}")
+
+def apply_rating_changes(changes, tracked, previous_data):
+    """Build updated records for tracked handles from a contest's rating changes.
+
+    tracked maps lower-cased handles to the handles in the roster. Contest rows
+    are matched ignoring case and stored under the roster's handle, so a user
+    keeps a single series in the tracking store. A handle renamed on
+    Codeforces after the watcher started is not matched at all: its new name
+    is not in tracked until the next run_once resolves the rename.
+    """
+    updated = {}
+    now = datetime.now().isoformat()
+    
+    for change in changes:
+        handle = tracked.get(change["handle"].lower())
+        if handle is None:
+            continue
+        
+        previous = previous_data.get(handle) or {}
+        
+        # Skip changes that are already reflected in the stored data
+        last_updated = previous.get("last_updated")
+        if last_updated and tracking_store.to_timestamp(last_updated) >= change["ratingUpdateTimeSeconds"]:
+            continue
+        
+        rating = change["newRating"]
+        rank = ranks.rank_from_rating(rating)
+        max_rating = previous.get("max_rating", 0)
+        
+        updated[handle] = {
+            "handle": handle,
+            "rating": rating,
+            "rank": rank,
+            "max_rating": max(max_rating, rating),
+            "max_rank": rank if rating > max_rating else previous.get("max_rank", rank),
+            "last_updated": now
+        }
+    
+    return updated
+
+def watch(handles, poll_interval=WATCH_POLL_INTERVAL, group=None, output_format="table", out=None):
+    """Run until interrupted, updating tracked handles after each rated contest.
+
+    Reads the contest schedule from contest.list and sleeps until the next
+    contest ends. Once it has ended, contest.ratingChanges is polled (with
+    growing intervals) until the rating changes are published, and only the
+    tracked handles that took part are updated. No calls are made in between.
+    The changes are written to out in output_format.
+    """
+    tracked = {handle.lower(): handle for handle in handles}
+    watch_started = int(time.time())
+    done = set()
+    pending = {}  # contest id -> {"contest", "next_check", "interval"}
+    schedule_due = 0
+    next_end = None
+    
+    print(f"Watching {len(handles)} handles for rated contests. Press Ctrl+C to stop.")
+    
+    while True:
+        now = int(time.time())
+        # Each wake-up is a run of its own as far as retries are concerned
+        cf_api.retry_budget.reset()
+        
+        if now >= schedule_due:
+            contests = rating_cache.get_contest_list()
+            if contests is None:
+                schedule_due = now + poll_interval
+            else:
+                next_end = None
+                for contest in contests:
+                    end_time = rating_cache.contest_end_time(contest)
+                    if contest["id"] in done or contest["id"] in pending:
+                        continue
+                    if end_time > now:
+                        next_end = end_time if next_end is None else min(next_end, end_time)
+                    elif end_time > watch_started - rating_cache.PENDING_WINDOW:
+                        pending[contest["id"]] = {"contest": contest, "next_check": now, "interval": poll_interval}
+                
+                # Re-read the schedule when the next contest ends, or at least once a day
+                schedule_due = min(next_end or now + WATCH_SCHEDULE_INTERVAL, now + WATCH_SCHEDULE_INTERVAL)
+        
+        for contest_id, entry in list(pending.items()):
+            if entry["next_check"] > now:
+                continue
+            
+            contest = entry["contest"]
+            changes = rating_cache.get_contest_rating_changes(contest_id)
+            failed = changes is rating_cache.REQUEST_FAILED
+            
+            if changes and not failed:
+                del pending[contest_id]
+                done.add(contest_id)
+                
+                previous_data = tracking_store.latest_snapshot()
+                updated = apply_rating_changes(changes, tracked, previous_data)
+                print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M')}] Rating changes published for {contest.get('name', contest_id)}: "
+                      f"{len(updated)} tracked handles updated.")
+                
+                if updated:
+                    with metrics.stage("compare"):
+                        write_results(diff_rows(updated, previous_data, changed_only=True), output_format, out)
+                    with metrics.stage("save"):
+                        tracking_store.record_poll(updated)
+                        latest = load_baseline(handles)
+                        if group:
+                            update_user_data(latest, handles)
+                        else:
+                            save_user_data(latest)
+                
+                # Keep the metrics file current for as long as the watcher runs
+                metrics.save()
+            elif not failed and now - rating_cache.contest_end_time(contest) > rating_cache.PENDING_WINDOW:
+                # Unrated contest, or the changes were never published
+                del pending[contest_id]
+                done.add(contest_id)
+            else:
+                entry["interval"] = min(entry["interval"] * 2, WATCH_MAX_POLL_INTERVAL)
+                entry["next_check"] = now + entry["interval"]
+        
+        wake_up = min([schedule_due] + [entry["next_check"] for entry in pending.values()])
+        time.sleep(max(wake_up - int(time.time()), 1))
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Track changes in Codeforces ranks for a list of handles.")
+    parser.add_argument("--changed-only", action="store_true",
+                        help="only show handles whose rating or rank changed, and new handles")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and update handles only after rated contests finish")
+    parser.add_argument("--poll-interval", type=int, default=WATCH_POLL_INTERVAL,
+                        help="seconds before re-checking a finished contest for rating changes (default: %(default)s)")
+    parser.add_argument("--group", help=f"only track the handles in this group of {HANDLES_FILE}, keeping everyone else's data")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="table",
+                        help="output format of the results; with anything but table, progress messages "
+                             "go to stderr (default: %(default)s)")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    if args.watch and args.format not in WATCH_FORMATS:
+        # One JSON array or CSV header per contest would not parse as a single stream
+        parser.error(f"--format {args.format} cannot be used with --watch; use --format ndjson instead")
+    return args
+
+def main():
+    """Main function to run the Codeforces rank tracker."""
+    args = parse_args()
+    metrics.METRICS_FILE = args.metrics
+    if args.format == "table":
+        track(args)
+    else:
+        # Keep stdout for the results so it can be piped into other tools
+        out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            track(args, out)
+
+def track(args, out=None):
+    """Load the handles, then run once and, with --watch, keep watching."""
+    print(paint("Codeforces Rank Tracker", "bold", sys.stdout.isatty()))
+    print("Loading handles...")
+    with metrics.stage("load"):
+        handles = load_handles(args.group)
+    
+    if not handles and args.group:
+        print(f"No handles found in group {args.group} of {HANDLES_FILE}.")
+        return
+    if not handles:
+        print(f"No handles found in {HANDLES_FILE}. Please add some handles and try again.")
+        return
+    
+    try:
+        run_once(handles, args.changed_only, args.group, args.format, out)
+    except cf_api.APIUnavailableError as e:
+        print(f"Error: {e}")
+        if not args.watch:
+            return
+    finally:
+        if metrics.save():
+            print(f"Metrics saved to {metrics.METRICS_FILE}")
     
-    # Save current data for future comparison
-    save_user_data(current_data)
-    print(f"\nData saved to {USER_DATA_FILE}")
+    if args.watch:
+        # Pick up handles renamed during the first run
+        handles = load_handles(args.group)
+        while True:
+            try:
+                watch(handles, args.poll_interval, args.group, args.format, out)
+            except KeyboardInterrupt:
+                print("\nStopped watching.")
+                metrics.save()
+                return
+            except cf_api.APIUnavailableError as e:
+                # Keep the watcher alive through outages; the circuit breaker decides when to try again
+                print(f"Error: {e} Waiting {cf_api.CIRCUIT_BREAKER_COOLDOWN:.0f}s before watching again.")
+                time.sleep(cf_api.CIRCUIT_BREAKER_COOLDOWN)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,59 @@
+"""
+Diff engine for tracked Codeforces data.
+
+Compares two snapshots (handle -> record, as stored in user_data.json and the
+tracking store) and produces a compact, structured change set. Rendering is a
+separate stage, so consumers such as notifications or dashboards only have to
+look at the handles that actually changed.
+"""
+
+import ranks
+
+def rank_direction(old_rank, new_rank):
+    """Return 1 if new_rank is above old_rank, -1 if below, 0 otherwise."""
+    old_index = ranks.rank_ordinal(old_rank)
+    new_index = ranks.rank_ordinal(new_rank)
+    return (new_index > old_index) - (new_index < old_index)
+
+def diff_snapshots(current, previous):
+    """Compute the change set between two snapshots.
+
+    Returns a dict with:
+      "changed": one entry per handle whose rating or rank changed, with
+                 handle, old_rating, new_rating, delta, old_rank, new_rank
+                 and rank_direction (1 up, -1 down, 0 same)
+      "new":     handles present in current but not in previous
+      "removed": handles present in previous but not in current
+    """
+    changed = []
+    new = []
+
+    for handle, record in current.items():
+        old = previous.get(handle)
+        if not old:
+            new.append(handle)
+            continue
+
+        old_rating = old.get("rating", 0)
+        new_rating = record.get("rating", 0)
+        old_rank = old.get("rank", "unrated")
+        new_rank = record.get("rank", "unrated")
+        if old_rating == new_rating and old_rank == new_rank:
+            continue
+
+        changed.append({
+            "handle": handle,
+            "old_rating": old_rating,
+            "new_rating": new_rating,
+            "delta": new_rating - old_rating,
+            "old_rank": old_rank,
+            "new_rank": new_rank,
+            "rank_direction": rank_direction(old_rank, new_rank) if old_rank != new_rank else 0
+        })
+
+    removed = [handle for handle in previous if handle not in current]
+    return {"changed": changed, "new": new, "removed": removed}
+
+def has_changes(change_set):
+    """Check whether a change set contains anything at all."""
+    return bool(change_set["changed"] or change_set["new"] or change_set["removed"])
@@ -0,0 +1,167 @@
+"""
+Contest-centric ingestion of rating histories.
+
+Instead of one user.rating call per handle, walk contest.list once and fetch
+contest.ratingChanges for every finished contest, keeping only the rows of
+tracked handles. This costs one call per contest however many handles are
+tracked, so it is the cheaper way to build histories for large rosters.
+
+Progress is checkpointed per contest in a SQLite database, so an interrupted
+ingestion resumes where it stopped and later runs only fetch new contests.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import rating_cache
+
+# Constants
+INGEST_DB_FILE = os.getenv("CF_INGEST_DB", "contest_ingest.db")
+# Below this many handles to fetch, the contest list is not even requested
+INGEST_MIN_HANDLES = int(os.getenv("CF_INGEST_MIN_HANDLES", "100"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracked (
+    key TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS contests (
+    contest_id INTEGER PRIMARY KEY,
+    ingested_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    key TEXT NOT NULL,
+    contest_id INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL,
+    change TEXT NOT NULL,
+    PRIMARY KEY (key, contest_id)
+);
+"""
+
+def connect():
+    """Open the checkpoint database, creating the schema if needed."""
+    conn = sqlite3.connect(INGEST_DB_FILE)
+    conn.executescript(SCHEMA)
+    return conn
+
+def prepare(conn, handles):
+    """Make sure the checkpoint covers every handle, starting over if it does not.
+
+    Contests already ingested only kept rows for the handles tracked at the
+    time, so a handle that is new to the checkpoint needs every contest again.
+    """
+    keys = {handle.lower() for handle in handles}
+    tracked = {row[0] for row in conn.execute("SELECT key FROM tracked")}
+    if keys <= tracked:
+        return tracked
+
+    if tracked:
+        print(f"{len(keys - tracked)} handles are new to the contest checkpoint. Starting the ingestion over.")
+    keys |= tracked
+    with conn:
+        conn.execute("DELETE FROM tracked")
+        conn.execute("DELETE FROM contests")
+        conn.execute("DELETE FROM changes")
+        conn.executemany("INSERT INTO tracked (key) VALUES (?)", ((key,) for key in keys))
+    return keys
+
+def get_finished_contests():
+    """Return all finished (non-gym) contests, oldest first, or None on failure."""
+    return rating_cache.get_finished_contests(0)
+
+def remaining_contests(contests):
+    """Return the contests that have not been ingested yet."""
+    if not os.path.exists(INGEST_DB_FILE):
+        return contests
+
+    conn = connect()
+    try:
+        done = {row[0] for row in conn.execute("SELECT contest_id FROM contests")}
+    finally:
+        conn.close()
+    return [contest for contest in contests if contest["id"] not in done]
+
+def ingest_contest(conn, contest, tracked, now):
+    """Fetch one contest's rating changes and checkpoint the tracked handles' rows.
+
+    Returns the number of rows kept, or None if the request failed. Contests
+    whose changes are not published yet, or could not be fetched, are left
+    for a later run.
+    """
+    changes = rating_cache.get_contest_rating_changes(contest["id"])
+    if changes is rating_cache.REQUEST_FAILED:
+        return None
+    # An empty answer within the window usually means the changes are not
+    # published yet, as in rating_cache.sync and the watcher
+    if not changes and rating_cache.contest_end_time(contest) > now - rating_cache.PENDING_WINDOW:
+        return 0
+
+    rows = [
+        (change["handle"].lower(), contest["id"], change["ratingUpdateTimeSeconds"], json.dumps(change))
+        for change in changes or [] if change["handle"].lower() in tracked
+    ]
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO changes (key, contest_id, updated_at, change) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO contests (contest_id, ingested_at) VALUES (?, ?)",
+            (contest["id"], now)
+        )
+    return len(rows)
+
+def load_histories(conn, handles):
+    """Build the rating history of each handle from the checkpointed rows."""
+    histories = {handle: [] for handle in handles}
+    by_key = {handle.lower(): handle for handle in handles}
+    rows = conn.execute("SELECT key, change FROM changes ORDER BY key, updated_at")
+    for key, change in rows:
+        if key in by_key:
+            histories[by_key[key]].append(json.loads(change))
+    return histories
+
+def ingest(handles, contests=None, cache=None):
+    """Build the rating histories of the given handles from contest.ratingChanges.
+
+    contests is the list of finished contests (fetched if not given). Each
+    contest is checkpointed as soon as it is processed. The histories are
+    stored in the rating cache, if one is given, and returned as a dict of
+    handle -> rating history; handles that never took part in a rated
+    contest get an empty history. Returns None if the contest list or any
+    contest's rating changes could not be fetched, since the histories would
+    have gaps; the contests that were fetched stay checkpointed.
+    """
+    if contests is None:
+        contests = get_finished_contests()
+        if contests is None:
+            return None
+
+    now = int(time.time())
+    conn = connect()
+    try:
+        tracked = prepare(conn, handles)
+        todo = remaining_contests(contests)
+        print(f"Ingesting rating changes from {len(todo)} contests for {len(handles)} handles "
+              f"({len(contests) - len(todo)} contests already done)...")
+
+        failed = 0
+        for i, contest in enumerate(todo):
+            kept = ingest_contest(conn, contest, tracked, now)
+            if kept is None:
+                failed += 1
+                print(f"Contest {i+1}/{len(todo)}: {contest.get('name', contest['id'])} could not be fetched")
+            else:
+                print(f"Contest {i+1}/{len(todo)}: {contest.get('name', contest['id'])} ({kept} tracked handles)")
+
+        if failed:
+            print(f"Rating changes of {failed} contests could not be fetched; they will be retried on the next run.")
+            return None
+        histories = load_histories(conn, handles)
+    finally:
+        conn.close()
+
+    if cache is not None:
+        for handle, history in histories.items():
+            rating_cache.store(cache, handle, history)
+    return histories
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Export tracking and historical data in a long, typed columnar layout.
+
+Each row is one rating change: (handle, timestamp, contest_id, old_rating,
+new_rating, rank). Unlike the wide CSV exports, the result can be loaded into
+pandas or Spark without re-parsing and pivoting. Written as Parquet or Arrow
+IPC in row-group batches, so memory use does not grow with the roster.
+
+Requires pyarrow (pip install pyarrow).
+"""
+
+import os
+import argparse
+from atomic_file import atomic_write
+import cf_api
+import metrics
+import ranks
+import tracking_store
+from historical_ranks import load_handles, fetch_rating_histories, add_fetch_arguments, HANDLES_FILE
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pyarrow is optional
+    pa = None
+
+# Constants
+OUTPUT_FILES = {
+    "history": "historical_codeforces_ranks",
+    "tracking": "codeforces_ranks"
+}
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+# Rows per row group (Parquet) or record batch (Arrow IPC)
+BATCH_SIZE = int(os.getenv("CF_EXPORT_BATCH_SIZE", "50000"))
+
+COLUMNS = ["handle", "timestamp", "contest_id", "old_rating", "new_rating", "rank"]
+
+def get_schema():
+    """Return the Arrow schema of the exported rows."""
+    return pa.schema([
+        ("handle", pa.string()),
+        ("timestamp", pa.timestamp("s", tz="UTC")),
+        ("contest_id", pa.int32()),
+        ("old_rating", pa.int32()),
+        ("new_rating", pa.int32()),
+        ("rank", pa.string())
+    ])
+
+def history_rows(handles, strategy):
+    """Yield one row per rated contest of each handle, from user.rating histories."""
+    for handle, rating_history in fetch_rating_histories(handles, strategy=strategy):
+        new_ratings = [change["newRating"] for change in rating_history]
+        for change, rank in zip(rating_history, ranks.ranks_from_ratings(new_ratings)):
+            yield (
+                handle,
+                change["ratingUpdateTimeSeconds"],
+                change["contestId"],
+                change["oldRating"],
+                change["newRating"],
+                rank
+            )
+
+def tracking_rows(handles):
+    """Yield one row per poll in the tracking store in which a handle's rating changed.
+
+    Polls carry no contest, so contest_id is always null; the first poll of a
+    handle has no old_rating.
+    """
+    previous_handle = None
+    previous_rating = None
+    for handle, polled_at, rating, rank in tracking_store.iter_polls(handles):
+        if handle != previous_handle:
+            yield (handle, polled_at, None, None, rating, rank)
+        elif rating != previous_rating:
+            yield (handle, polled_at, None, previous_rating, rating, rank)
+        previous_handle = handle
+        previous_rating = rating
+
+def batches(rows, batch_size):
+    """Group rows into Arrow record batches of at most batch_size rows."""
+    schema = get_schema()
+    buffer = []
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) >= batch_size:
+            yield to_record_batch(buffer, schema)
+            buffer = []
+    if buffer:
+        yield to_record_batch(buffer, schema)
+
+def to_record_batch(rows, schema):
+    """Convert a list of row tuples into a record batch."""
+    columns = list(zip(*rows))
+    arrays = [pa.array(column, type=field.type) for column, field in zip(columns, schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def write_columnar(rows, path, fmt, batch_size=BATCH_SIZE):
+    """Write rows to a Parquet or Arrow IPC file, one batch at a time. Returns the row count."""
+    schema = get_schema()
+    count = 0
+    with atomic_write(path, mode="wb") as f:
+        if fmt == "parquet":
+            writer = pa.parquet.ParquetWriter(f, schema, compression="zstd")
+        else:
+            writer = pa.ipc.new_file(f, schema)
+        try:
+            for batch in batches(rows, batch_size):
+                if fmt == "parquet":
+                    writer.write_table(pa.Table.from_batches([batch]), row_group_size=batch_size)
+                else:
+                    writer.write_batch(batch)
+                count += batch.num_rows
+        finally:
+            writer.close()
+    return count
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Export Codeforces rating changes to Parquet or Arrow IPC.")
+    parser.add_argument("handles", nargs="*", help=f"handles to export (default: read from {HANDLES_FILE})")
+    parser.add_argument("--group", help=f"only export the handles in this group of {HANDLES_FILE}")
+    parser.add_argument("--source", choices=sorted(OUTPUT_FILES), default="history",
+                        help="export contest rating histories (default) or the polls in the tracking store")
+    parser.add_argument("--format", choices=sorted(EXTENSIONS), default="parquet", dest="fmt",
+                        help="output file format (default: parquet)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"rows per row group / record batch (default: {BATCH_SIZE})")
+    add_fetch_arguments(parser)
+    parser.add_argument("-o", "--output", help="output file (default: depends on --source and --format)")
+    metrics.add_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    """Main function."""
+    args = parse_args()
+    metrics.METRICS_FILE = args.metrics
+    try:
+        export(args)
+    finally:
+        if metrics.save():
+            print(f"Metrics saved to {metrics.METRICS_FILE}")
+
+def export(args):
+    """Export the rating changes asked for on the command line."""
+    if pa is None:
+        print("Error: pyarrow is required for columnar exports. Install it with: pip install pyarrow")
+        return
+    
+    output_file = args.output or OUTPUT_FILES[args.source] + EXTENSIONS[args.fmt]
+    handles = [handle.strip() for handle in args.handles] or None
+    if not handles and args.group:
+        handles = load_handles(args.group)
+        if not handles:
+            return
+    
+    if args.source == "tracking":
+        if not tracking_store.exists():
+            print(f"Error: {tracking_store.TRACKING_DB_FILE} not found. Run cf_tracker.py first.")
+            return
+        rows = tracking_rows(handles)
+    else:
+        handles = handles or load_handles()
+        if not handles:
+            print("No handles provided. Please add handles to handles.txt or provide them as command-line arguments.")
+            return
+        rows = history_rows(handles, args.fetch)
+    
+    try:
+        count = write_columnar(rows, output_file, args.fmt, args.batch_size)
+    except cf_api.APIUnavailableError as e:
+        print(f"Error: {e}")
+        return
+    print(f"Data exported to {output_file}")
+    print(f"Total rows: {count}")
+
+if __name__ == "__main__":
+    main()
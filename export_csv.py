@@ -7,53 +7,69 @@ import os
 import json
 import csv
 from datetime import datetime
+import tracking_store
+import handle_registry
+from atomic_file import atomic_write
 
+HANDLES_FILE = "handles.txt"
 USER_DATA_FILE = "user_data.json"
 CSV_OUTPUT_FILE = "codeforces_ranks.csv"
 
-def export_to_csv():
-    """Export user data from JSON to CSV format."""
-    if not os.path.exists(USER_DATA_FILE):
-        print(f"Error: {USER_DATA_FILE} not found. Run cf_tracker.py first.")
-        return
-    
+FIELDNAMES = ["Handle", "Rating", "Rank", "Max Rating", "Max Rank", "Last Updated"]
+
+def load_legacy_records():
+    """Return the records in user_data.json, highest rating first, or None on error."""
     try:
         with open(USER_DATA_FILE, "r") as f:
             user_data = json.load(f)
     except json.JSONDecodeError:
         print(f"Error: {USER_DATA_FILE} is corrupted.")
-        return
+        return None
     
-    if not user_data:
-        print("No user data found.")
+    records = [dict(data, handle=handle) for handle, data in user_data.items()]
+    records.sort(key=lambda x: x.get("rating", 0), reverse=True)
+    return records
+
+def export_to_csv():
+    """Export the latest tracked data to CSV format."""
+    if tracking_store.exists():
+        # Only the current roster is exported; handles removed from it keep
+        # their history in the store but are left out
+        roster = handle_registry.load_handles(HANDLES_FILE) if os.path.exists(HANDLES_FILE) else None
+        # Rows are streamed from the database already sorted by rating (descending)
+        records = tracking_store.iter_snapshot(roster, order_by="rating DESC, handle")
+    elif os.path.exists(USER_DATA_FILE):
+        # Data from before the tracking store was introduced
+        records = load_legacy_records()
+        if records is None:
+            return
+    else:
+        print(f"Error: {tracking_store.TRACKING_DB_FILE} not found. Run cf_tracker.py first.")
         return
     
-    # Prepare data for CSV
-    csv_data = []
-    for handle, data in user_data.items():
-        csv_data.append({
-            "Handle": handle,
-            "Rating": data.get("rating", 0),
-            "Rank": data.get("rank", "unrated"),
-            "Max Rating": data.get("max_rating", 0),
-            "Max Rank": data.get("max_rank", "unrated"),
-            "Last Updated": data.get("last_updated", "")
-        })
-    
-    # Sort by rating (descending)
-    csv_data.sort(key=lambda x: x["Rating"], reverse=True)
-    
-    # Write to CSV
-    with open(CSV_OUTPUT_FILE, "w", newline="") as f:
-        fieldnames = ["Handle", "Rating", "Rank", "Max Rating", "Max Rank", "Last Updated"]
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+    # Write each row as soon as it is read
+    count = 0
+    with atomic_write(CSV_OUTPUT_FILE, newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
         
         writer.writeheader()
-        for row in csv_data:
-            writer.writerow(row)
+        for data in records:
+            writer.writerow({
+                "Handle": data["handle"],
+                "Rating": data.get("rating", 0),
+                "Rank": data.get("rank", "unrated"),
+                "Max Rating": data.get("max_rating", 0),
+                "Max Rank": data.get("max_rank", "unrated"),
+                "Last Updated": data.get("last_updated", "")
+            })
+            count += 1
+    
+    if not count:
+        print("No user data found.")
+        return
     
     print(f"Data exported to {CSV_OUTPUT_FILE}")
-    print(f"Total records: {len(csv_data)}")
+    print(f"Total records: {count}")
 
 if __name__ == "__main__":
     export_to_csv() 
\ No newline at end of file
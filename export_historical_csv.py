@@ -1,78 +1,162 @@
 #!/usr/bin/env python3
 
 import os
-import sys
 import csv
-import time
+import argparse
 from datetime import datetime
-from historical_ranks import load_handles, get_historical_ratings, colorize_rank
+import cf_api
+import metrics
+import snapshots
+from atomic_file import partial_path, finish_partial
+from historical_ranks import load_handles, fetch_rating_histories, get_snapshot_ratings, add_fetch_arguments, HANDLES_FILE
 
 # Constants
 OUTPUT_FILE = "historical_codeforces_ranks.csv"
-YEARS = [2022, 2023, 2024]  # Target years for March
+# Rows written between flushes of the partial export to disk
+FLUSH_EVERY = 50
 
-def strip_ansi_codes(text):
-    """Remove ANSI color codes from text."""
-    import re
-    ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-    return ansi_escape.sub('', text)
+def read_partial_handles(path, headers):
+    """Return the handles already written to a partial export with the same columns.
+
+    A partial file with different columns (e.g. other dates) is discarded, and
+    a half-written last row left by a crash is cut off.
+    """
+    if not os.path.exists(path):
+        return set()
+    
+    done = set()
+    with open(path, "rb+") as f:
+        header = next(csv.reader([f.readline().decode()]), None)
+        if header != headers:
+            print(f"Discarding {path}: it was started with different columns.")
+            f.truncate(0)
+            return done
+        
+        end = f.tell()
+        for line in iter(f.readline, b""):
+            row = next(csv.reader([line.decode()]), [])
+            if not line.endswith(b"\n") or len(row) != len(headers):
+                break
+            done.add(row[0])
+            end = f.tell()
+        f.truncate(end)
+    
+    return done
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Export historical Codeforces ratings to CSV.")
+    parser.add_argument("handles", nargs="*", help=f"handles to export (default: read from {HANDLES_FILE})")
+    parser.add_argument("--group", help=f"only export the handles in this group of {HANDLES_FILE}")
+    snapshots.add_date_arguments(parser)
+    add_fetch_arguments(parser)
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore any partial export left by an interrupted run and start over")
+    metrics.add_arguments(parser)
+    return parser.parse_args()
 
 def main():
     """Main function."""
-    if len(sys.argv) > 1:
-        handles = [handle.strip() for handle in sys.argv[1:]]
+    args = parse_args()
+    metrics.METRICS_FILE = args.metrics
+    try:
+        export(args)
+    finally:
+        if metrics.save():
+            print(f"Metrics saved to {metrics.METRICS_FILE}")
+
+def export(args):
+    """Export the historical ratings asked for on the command line."""
+    if args.handles:
+        handles = [handle.strip() for handle in args.handles]
     else:
-        handles = load_handles()
+        handles = load_handles(args.group)
     
     if not handles:
         print("No handles provided. Please add handles to handles.txt or provide them as command-line arguments.")
         return
     
-    # Prepare data for CSV
-    csv_data = []
+    try:
+        step = snapshots.grid_step(args)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
     
     # Create headers
     headers = ["Handle"]
-    for year in YEARS:
-        headers.extend([f"March {year} Rating", f"March {year} Rank", f"March {year} Contest Date"])
     
-    csv_data.append(headers)
+    def add_headers(dates):
+        for date in dates:
+            label = snapshots.date_label(date, step)
+            headers.extend([f"{label} Rating", f"{label} Rank", f"{label} Contest Date"])
     
-    # Process each handle
-    for i, handle in enumerate(handles):
-        print(f"Processing handle {i+1}/{len(handles)}: {handle}")
-        
-        historical_data = get_historical_ratings(handle, YEARS)
+    # Rows are appended to a partial file as soon as they are ready; a crashed
+    # export with the same columns is resumed by skipping handles already in it
+    partial = partial_path(OUTPUT_FILE)
+    if args.restart and os.path.exists(partial):
+        os.remove(partial)
+    
+    try:
+        if step == "contest":
+            # Contest dates are only known once every history has been fetched,
+            # so this export cannot be resumed or streamed
+            histories = list(fetch_rating_histories(handles, strategy=args.fetch))
+            dates = snapshots.dates_from_args(args, [history for _, history in histories])
+            add_headers(dates)
+            done = set()
+            if os.path.exists(partial):
+                os.remove(partial)
+        else:
+            dates = snapshots.dates_from_args(args)
+            add_headers(dates)
+            done = read_partial_handles(partial, headers)
+            if done:
+                print(f"Resuming export: {len(done)} handles already in {partial}.")
+            histories = fetch_rating_histories([h for h in handles if h not in done], strategy=args.fetch)
         
-        if historical_data:
-            row = [handle]
+        with open(partial, "a", newline="") as f:
+            writer = csv.writer(f)
+            if f.tell() == 0:
+                writer.writerow(headers)
             
-            for data in historical_data:
-                if data["rating"] is not None:
-                    row.append(data["rating"])
-                    row.append(strip_ansi_codes(data["rank"].title()))
-                    row.append(data["contest_date"])
+            # Process each handle
+            for i, (handle, rating_history) in enumerate(histories, start=len(done)):
+                print(f"Processing handle {i+1}/{len(handles)}: {handle}")
+                
+                historical_data = get_snapshot_ratings(handle, dates, rating_history, args.mode)
+                
+                if historical_data:
+                    row = [handle]
+                    
+                    for data in historical_data:
+                        if data["rating"] is not None:
+                            row.append(data["rating"])
+                            row.append(data["rank"].title())
+                            row.append(data["contest_date"])
+                        else:
+                            row.append("")
+                            row.append("")
+                            row.append("")
                 else:
-                    row.append("")
-                    row.append("")
-                    row.append("")
-            
-            csv_data.append(row)
-        else:
-            # If no data is available, add empty cells
-            row = [handle] + ["", "", ""] * len(YEARS)
-            csv_data.append(row)
-        
-        # Add a small delay to avoid hitting API rate limits
-        time.sleep(1)
+                    # If no data is available, add empty cells
+                    row = [handle] + ["", "", ""] * len(dates)
+                
+                writer.writerow(row)
+                done.add(handle)
+                
+                if (i + 1) % FLUSH_EVERY == 0:
+                    f.flush()
+                    os.fsync(f.fileno())
+    except cf_api.APIUnavailableError as e:
+        print(f"Error: {e}")
+        print(f"The rows written so far are kept in {partial}; run the export again to resume it.")
+        return
     
-    # Write to CSV file
-    with open(OUTPUT_FILE, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerows(csv_data)
+    # Move the completed export into place
+    finish_partial(OUTPUT_FILE)
     
     print(f"\nHistorical data exported to {OUTPUT_FILE}")
     print(f"Total handles processed: {len(handles)}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,365 @@
+"""
+Indexed registry of tracked Codeforces handles.
+
+Roster files (handles.txt) stay the place where handles are edited by hand,
+but they are only parsed again when their modification time or size changes.
+The parsed roster is kept in a SQLite database together with metadata for each
+handle: its groups, when it was added, when it was last validated and its
+canonical casing as returned by the API. Validation results (valid, invalid or
+renamed) are cached too, so handles are only checked again once they expire.
+
+Handles are matched case-insensitively, as Codeforces does, so "Tourist" and
+"tourist" are the same handle. A roster file can assign handles to groups with
+header lines; every handle below a header belongs to that group:
+
+    # group: batch-2025
+    tourist
+    Petr
+    # group:
+    ecnerwala
+"""
+
+import os
+import re
+import time
+import sqlite3
+from atomic_file import atomic_write
+
+# Constants
+REGISTRY_DB_FILE = os.getenv("CF_REGISTRY_DB", "handles.db")
+# How long validation results are trusted before a handle is checked again (seconds)
+VALID_TTL = int(os.getenv("CF_VALID_TTL", str(30 * 86400)))
+INVALID_TTL = int(os.getenv("CF_INVALID_TTL", str(86400)))
+RENAMED_TTL = int(os.getenv("CF_RENAMED_TTL", str(7 * 86400)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS handles (
+    key TEXT PRIMARY KEY,
+    handle TEXT NOT NULL,
+    added_at INTEGER NOT NULL,
+    validated_at INTEGER
+);
+CREATE TABLE IF NOT EXISTS members (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (source, key, grp)
+);
+CREATE INDEX IF NOT EXISTS members_group ON members (source, grp, position);
+CREATE TABLE IF NOT EXISTS validations (
+    key TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    handle TEXT,
+    checked_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    last_group TEXT NOT NULL
+);
+"""
+
+GROUP_HEADER = re.compile(r"#\s*group:\s*(.*)$", re.IGNORECASE)
+
+def connect():
+    """Open the registry database, creating the schema if needed."""
+    conn = sqlite3.connect(REGISTRY_DB_FILE)
+    conn.executescript(SCHEMA)
+    return conn
+
+def normalize(handle):
+    """Return the case-insensitive key of a handle."""
+    return handle.strip().lower()
+
+def source_key(path):
+    """Return the key under which a roster file is stored."""
+    return os.path.abspath(path)
+
+def parse_roster(path):
+    """Parse a roster file into (handle, group) pairs, in file order.
+
+    Also returns the group in effect at the end of the file.
+    """
+    entries = []
+    group = ""
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                match = GROUP_HEADER.match(line)
+                if match:
+                    group = match.group(1).strip()
+                continue
+            entries.append((line, group))
+    return entries, group
+
+def sync(path, conn=None):
+    """Re-index a roster file if it changed since it was last indexed."""
+    own_conn = conn is None
+    if own_conn:
+        conn = connect()
+    try:
+        stat = os.stat(path)
+        source = source_key(path)
+        row = conn.execute("SELECT mtime_ns, size FROM sources WHERE path = ?", (source,)).fetchone()
+        if row == (stat.st_mtime_ns, stat.st_size):
+            return
+
+        entries, last_group = parse_roster(path)
+        now = int(time.time())
+        with conn:
+            conn.execute("DELETE FROM members WHERE source = ?", (source,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO handles (key, handle, added_at) VALUES (?, ?, ?)",
+                ((normalize(handle), handle, now) for handle, _ in entries)
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO members (source, key, grp, position) VALUES (?, ?, ?, ?)",
+                ((source, normalize(handle), group, position) for position, (handle, group) in enumerate(entries))
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sources (path, mtime_ns, size, last_group) VALUES (?, ?, ?, ?)",
+                (source, stat.st_mtime_ns, stat.st_size, last_group)
+            )
+    finally:
+        if own_conn:
+            conn.close()
+
+def load_handles(path, group=None):
+    """Return the handles in a roster file (optionally only one group), in canonical casing.
+
+    Each handle appears once, at the position where it is first listed.
+    """
+    conn = connect()
+    try:
+        sync(path, conn)
+        query = "SELECT handles.handle, MIN(position) AS first FROM members JOIN handles USING (key) WHERE source = ?"
+        params = [source_key(path)]
+        if group is not None:
+            query += " AND grp = ?"
+            params.append(group)
+        query += " GROUP BY key ORDER BY first"
+        return [row[0] for row in conn.execute(query, params)]
+    finally:
+        conn.close()
+
+def load_index(path):
+    """Return a dict of normalized handle -> canonical handle for a roster file.
+
+    Membership checks against the dict are O(1) in memory.
+    """
+    conn = connect()
+    try:
+        sync(path, conn)
+        rows = conn.execute(
+            "SELECT DISTINCT key, handles.handle FROM members JOIN handles USING (key) WHERE source = ?",
+            (source_key(path),)
+        )
+        return dict(rows.fetchall())
+    finally:
+        conn.close()
+
+def list_groups(path):
+    """Return the groups used in a roster file with the number of handles in each."""
+    conn = connect()
+    try:
+        sync(path, conn)
+        rows = conn.execute(
+            "SELECT grp, COUNT(*) FROM members WHERE source = ? GROUP BY grp ORDER BY grp",
+            (source_key(path),)
+        )
+        return dict(rows.fetchall())
+    finally:
+        conn.close()
+
+def add_handles(path, handles, group=None):
+    """Append handles that are not listed yet (ignoring case) to a roster file.
+
+    With a group, the handles are added under a "# group:" header for it, and
+    only handles already in that group are skipped, so a handle can belong to
+    several groups. Returns the handles that were added.
+    """
+    group = group or ""
+    source = source_key(path)
+    if not os.path.exists(path):
+        with open(path, "w") as f:
+            f.write("# Add your students' Codeforces handles below (one per line)\n")
+
+    conn = connect()
+    try:
+        sync(path, conn)
+        query = "SELECT key FROM members WHERE source = ?"
+        params = [source]
+        if group:
+            query += " AND grp = ?"
+            params.append(group)
+        existing = {row[0] for row in conn.execute(query, params)}
+        new_handles = []
+        for handle in handles:
+            handle = handle.strip()
+            if handle and normalize(handle) not in existing:
+                existing.add(normalize(handle))
+                new_handles.append(handle)
+        if not new_handles:
+            return []
+
+        last_group, = conn.execute("SELECT last_group FROM sources WHERE path = ?", (source,)).fetchone()
+        position, = conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM members WHERE source = ?", (source,)).fetchone()
+
+        with open(path, "r+") as f:
+            # Make sure the appended lines do not join the file's last line
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                needs_newline = f.read(1) != "\n"
+            else:
+                needs_newline = False
+            if needs_newline:
+                f.write("\n")
+            if group != last_group:
+                f.write(f"# group: {group}\n" if group else "# group:\n")
+            for handle in new_handles:
+                f.write(f"{handle}\n")
+
+        # Index the appended lines directly instead of parsing the whole file again
+        stat = os.stat(path)
+        now = int(time.time())
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO handles (key, handle, added_at) VALUES (?, ?, ?)",
+                ((normalize(handle), handle, now) for handle in new_handles)
+            )
+            conn.executemany(
+                "INSERT INTO members (source, key, grp, position) VALUES (?, ?, ?, ?)",
+                ((source, normalize(handle), group, position + i) for i, handle in enumerate(new_handles))
+            )
+            conn.execute(
+                "UPDATE sources SET mtime_ns = ?, size = ?, last_group = ? WHERE path = ?",
+                (stat.st_mtime_ns, stat.st_size, group, source)
+            )
+        return new_handles
+    finally:
+        conn.close()
+
+def remove_handles(path, handles):
+    """Remove handles (ignoring case) from a roster file. Returns the number of lines removed."""
+    if not os.path.exists(path):
+        return 0
+
+    keys = {normalize(handle) for handle in handles}
+    with open(path, "r") as f:
+        lines = f.readlines()
+
+    kept = [line for line in lines if line.strip().startswith("#") or normalize(line) not in keys]
+    if len(kept) == len(lines):
+        return 0
+
+    with atomic_write(path, backups=0) as f:
+        f.writelines(kept)
+    sync(path)
+    return len(lines) - len(kept)
+
+def rename_handles(path, renames):
+    """Rewrite renamed (or re-cased) handles in a roster file in one pass.
+
+    renames maps old handles to their canonical new ones. Duplicates created
+    by the rewrite (the new handle already listed in the same group) are
+    dropped. Returns the number of lines changed.
+    """
+    if not renames or not os.path.exists(path):
+        return 0
+
+    new_handles = {normalize(old): new for old, new in renames.items()}
+    with open(path, "r") as f:
+        lines = f.readlines()
+
+    output = []
+    seen = set()
+    group = ""
+    changed = 0
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            match = GROUP_HEADER.match(stripped)
+            if match:
+                group = match.group(1).strip()
+            output.append(line)
+            continue
+
+        handle = new_handles.get(normalize(stripped), stripped)
+        if handle != stripped:
+            changed += 1
+        if (group, normalize(handle)) in seen:
+            continue
+        seen.add((group, normalize(handle)))
+        output.append(f"{handle}\n")
+
+    if changed:
+        with atomic_write(path, backups=0) as f:
+            f.writelines(output)
+        sync(path)
+    return changed
+
+def validation_ttl(status):
+    """Return how long (in seconds) a validation result with the given status stays fresh."""
+    return {"valid": VALID_TTL, "invalid": INVALID_TTL, "renamed": RENAMED_TTL}[status]
+
+def cached_validations(handles):
+    """Return the fresh cached validation results for the given handles, by normalized key.
+
+    Each result is a dict with status ("valid", "invalid" or "renamed"), handle
+    (the canonical handle, or None for invalid handles) and checked_at.
+    Results older than their status's TTL are left out.
+    """
+    keys = list({normalize(handle) for handle in handles})
+    now = int(time.time())
+    conn = connect()
+    try:
+        results = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, status, handle, checked_at FROM validations WHERE key IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            )
+            for key, status, handle, checked_at in rows:
+                if now - checked_at < validation_ttl(status):
+                    results[key] = {"status": status, "handle": handle, "checked_at": checked_at}
+        return results
+    finally:
+        conn.close()
+
+def record_validations(users, invalid):
+    """Cache the results of a user.info lookup and store canonical casing of valid handles.
+
+    users maps each requested handle to the user object returned for it; a
+    returned handle that differs from the requested one by more than letter
+    case means the account was renamed. invalid lists handles not found.
+    Returns the recorded results in the same form as cached_validations.
+    """
+    now = int(time.time())
+    rows = []
+    for requested, user in users.items():
+        status = "valid" if normalize(requested) == normalize(user["handle"]) else "renamed"
+        rows.append((normalize(requested), status, user["handle"], now))
+    rows.extend((normalize(handle), "invalid", None, now) for handle in invalid)
+
+    conn = connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO validations (key, status, handle, checked_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            conn.executemany(
+                "UPDATE handles SET handle = ?, validated_at = ? WHERE key = ?",
+                ((handle, now, key) for key, status, handle, _ in rows if status == "valid")
+            )
+    finally:
+        conn.close()
+
+    return {key: {"status": status, "handle": handle, "checked_at": now} for key, status, handle, _ in rows}
@@ -1,183 +1,162 @@
 #!/usr/bin/env python3
 
 import os
-import sys
 import json
-import time
-import hashlib
-import random
+import argparse
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import calendar
-from dotenv import load_dotenv
 from tabulate import tabulate
-import urllib.parse
-
-# Load environment variables from .env file
-load_dotenv()
+import cf_api
+import metrics
+import rating_cache
+import contest_ingest
+import ranks
+import handle_registry
+import snapshots
 
 # Constants
-API_KEY = os.getenv("CODEFORCES_API_KEY")
-SECRET = os.getenv("CODEFORCES_SECRET")
-HANDLES_FILE = "private_handles.txt"
-
-# ANSI color codes for different ranks
-RANK_COLORS = {
-    "newbie": "\033[90m",  # Gray
-    "pupil": "\033[92m",  # Green
-    "specialist": "\033[96m",  # Cyan
-    "expert": "\033[94m",  # Blue
-    "candidate master": "\033[95m",  # Purple
-    "master": "\033[93m",  # Yellow
-    "international master": "\033[93m",  # Yellow
-    "grandmaster": "\033[91m",  # Red
-    "international grandmaster": "\033[91m",  # Red
-    "legendary grandmaster": "\033[91m",  # Red
-}
-RESET_COLOR = "\033[0m"  # Reset color
-
-def create_authenticated_url(method_name, params=None):
-    """Create an authenticated URL for the Codeforces API."""
-    if params is None:
-        params = {}
-    
-    if not API_KEY or not SECRET:
-        # If API credentials are not available, return a non-authenticated URL
-        base_url = f"https://codeforces.com/api/{method_name}"
-        if params:
-            query_string = "&".join([f"{k}={urllib.parse.quote(str(v))}" for k, v in params.items()])
-            return f"{base_url}?{query_string}"
-        return base_url
-    
-    # Add authentication parameters
-    unix_time = int(time.time())
-    params["apiKey"] = API_KEY
-    params["time"] = unix_time
-    
-    # Create a random string for the API signature
-    rand = random.randint(100000, 999999)
-    
-    # Create the API signature
-    sorted_params = sorted(params.items())
-    signature_string = f"{rand}/{method_name}?"
-    signature_string += "&".join([f"{k}={urllib.parse.quote(str(v))}" for k, v in sorted_params])
-    signature_string += f"#{SECRET}"
-    
-    # Calculate the API signature
-    signature = hashlib.sha512(signature_string.encode()).hexdigest()
-    
-    # Create the final URL
-    base_url = f"https://codeforces.com/api/{method_name}"
-    query_string = "&".join([f"{k}={urllib.parse.quote(str(v))}" for k, v in params.items()])
-    query_string += f"&apiSig={rand}{signature}"
-    
-    return f"{base_url}?{query_string}"
+HANDLES_FILE = "handles.txt"
+# Handles used to be read from a separate file, which can be imported as a group
+LEGACY_HANDLES_FILE = "private_handles.txt"
+LEGACY_GROUP = "private"
+# Number of user.rating requests kept in flight; pacing is still enforced by cf_api
+MAX_WORKERS = int(os.getenv("CF_MAX_WORKERS", "4"))
+# How rating histories are fetched: per handle (user.rating), per contest
+# (contest.ratingChanges), or whichever needs fewer calls
+FETCH_STRATEGIES = ["auto", "handles", "contests"]
+FETCH_STRATEGY = os.getenv("CF_FETCH_STRATEGY", "auto")
 
-def get_rating_history(handle):
-    """Get the rating history for a user."""
-    url = create_authenticated_url("user.rating", {"handle": handle})
-    
+def request_rating_history(handle):
+    """Download the rating history for a user, returning None if the request failed."""
     try:
-        response = requests.get(url)
+        response = cf_api.request("user.rating", {"handle": handle})
         response.raise_for_status()
-        data = response.json()
+        data = cf_api.decode("user.rating", response)
         
         if data["status"] == "OK":
             return data["result"]
         else:
             print(f"Error fetching rating history for {handle}: {data.get('comment', 'Unknown error')}")
-            return []
+            return None
     except requests.exceptions.RequestException as e:
         print(f"Request Error: {e}")
         # Try individual request without authentication as fallback
         try:
-            fallback_url = f"https://codeforces.com/api/user.rating?handle={urllib.parse.quote(handle)}"
-            response = requests.get(fallback_url)
+            response = cf_api.request("user.rating", {"handle": handle}, authenticated=False)
             response.raise_for_status()
-            data = response.json()
+            data = cf_api.decode("user.rating", response)
             
             if data["status"] == "OK":
                 return data["result"]
             else:
                 print(f"Error fetching rating history for {handle}: {data.get('comment', 'Unknown error')}")
-                return []
+                return None
         except requests.exceptions.RequestException as e2:
             print(f"Fallback Request Error: {e2}")
-            return []
-
-def get_rank_from_rating(rating):
-    """Get the rank name based on the rating."""
-    if rating < 1200:
-        return "newbie"
-    elif rating < 1400:
-        return "pupil"
-    elif rating < 1600:
-        return "specialist"
-    elif rating < 1900:
-        return "expert"
-    elif rating < 2100:
-        return "candidate master"
-    elif rating < 2300:
-        return "master"
-    elif rating < 2400:
-        return "international master"
-    elif rating < 2600:
-        return "grandmaster"
-    elif rating < 3000:
-        return "international grandmaster"
-    else:
-        return "legendary grandmaster"
+            return None
 
-def colorize_rank(rank):
-    """Add color to a rank string."""
-    rank_lower = rank.lower()
-    color = RANK_COLORS.get(rank_lower, "")
-    return f"{color}{rank}{RESET_COLOR}"
+def get_rating_history(handle):
+    """Get the rating history for a user."""
+    return request_rating_history(handle) or []
 
-def find_closest_rating(rating_history, target_date):
-    """Find the rating closest to the target date."""
-    if not rating_history:
+def ingest_if_cheaper(handles, strategy, cache):
+    """Fetch histories contest by contest if the strategy asks for it or it needs fewer calls.
+
+    Returns a dict of handle -> rating history, or None if the histories
+    should be fetched per handle instead.
+    """
+    if strategy == "handles" or not handles:
+        return None
+    if strategy == "auto" and len(handles) <= contest_ingest.INGEST_MIN_HANDLES:
         return None
     
-    target_timestamp = int(target_date.timestamp())
-    
-    # Sort by time difference to target date
-    closest = min(rating_history, key=lambda x: abs(x["ratingUpdateTimeSeconds"] - target_timestamp))
-    
-    # Check if the closest rating is within 3 months of the target date
-    time_diff = abs(closest["ratingUpdateTimeSeconds"] - target_timestamp)
-    if time_diff > 7776000:  # 90 days in seconds
+    contests = contest_ingest.get_finished_contests()
+    if contests is None:
         return None
+    if strategy == "auto" and len(handles) <= len(contest_ingest.remaining_contests(contests)):
+        return None
+    
+    return contest_ingest.ingest(handles, contests, cache)
+
+def fetch_rating_histories(handles, max_workers=MAX_WORKERS, use_cache=True, strategy=FETCH_STRATEGY):
+    """Fetch rating histories for many handles concurrently.
+
+    Histories in the local rating cache are reused unless the user has taken
+    part in a contest since the last sync. The rest are fetched with one
+    user.rating call per handle or, for rosters larger than the number of
+    contests left to ingest, from contest.ratingChanges (see strategy and
+    contest_ingest). Yields (handle, rating_history) pairs in the original
+    handle order as soon as each one (and all handles before it) is available.
+    """
+    cache = rating_cache.load_cache() if use_cache and rating_cache.RATING_CACHE_FILE else None
+    if cache is not None and not rating_cache.sync(cache):
+        print("Could not check for new contests. Re-downloading all rating histories.")
+        to_fetch = list(handles)
+    elif cache is not None:
+        to_fetch = [handle for handle in handles if rating_cache.lookup(cache, handle) is None]
+        print(f"Using cached rating history for {len(handles) - len(to_fetch)} handles.")
+    else:
+        to_fetch = list(handles)
     
-    return closest
+    try:
+        ingested = ingest_if_cheaper(to_fetch, strategy, cache)
+        if ingested is not None:
+            to_fetch = []
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            fetched = zip(to_fetch, executor.map(request_rating_history, to_fetch))
+            pending = set(to_fetch)
+            
+            for handle in handles:
+                cached = rating_cache.lookup(cache, handle) if cache is not None else None
+                if ingested is not None and handle in ingested:
+                    history = ingested[handle]
+                elif handle in pending:
+                    _, history = next(fetched)
+                    if history is None:
+                        # Fall back to a possibly outdated cached copy
+                        history = cached
+                    elif cache is not None:
+                        rating_cache.store(cache, handle, history)
+                else:
+                    history = cached
+                
+                yield handle, history or []
+    finally:
+        if cache is not None:
+            rating_cache.save_cache(cache)
+
+def get_snapshot_ratings(handle, dates, rating_history=None, mode="closest"):
+    """Get a handle's rating and rank at each of the given dates.
 
-def get_historical_ratings(handle, years):
-    """Get historical ratings for a handle for specific months in different years."""
-    rating_history = get_rating_history(handle)
+    All dates are evaluated in one pass over the history (see snapshots.py).
+    If rating_history is not given it is fetched from the API.
+    """
+    if rating_history is None:
+        rating_history = get_rating_history(handle)
     if not rating_history:
         return None
     
     results = []
+    row = snapshots.snapshot_history(rating_history, dates, mode)
+    # Map the whole row of ratings to ranks at once
+    row_ranks = ranks.ranks_from_ratings([entry["newRating"] if entry else None for entry in row])
     
-    for year in years:
-        # Create a date object for March 15 of the specified year
-        target_date = datetime(year, 3, 15)
-        closest_rating = find_closest_rating(rating_history, target_date)
-        
-        if closest_rating:
-            rating = closest_rating["newRating"]
-            rank = get_rank_from_rating(rating)
-            contest_date = datetime.fromtimestamp(closest_rating["ratingUpdateTimeSeconds"])
+    for date, entry, rank in zip(dates, row, row_ranks):
+        if entry:
+            rating = entry["newRating"]
+            contest_date = datetime.fromtimestamp(entry["ratingUpdateTimeSeconds"])
             
             results.append({
-                "year": year,
+                "date": date,
                 "rating": rating,
                 "rank": rank,
                 "contest_date": contest_date.strftime("%Y-%m-%d")
             })
         else:
             results.append({
-                "year": year,
+                "date": date,
                 "rating": None,
                 "rank": None,
                 "contest_date": None
@@ -185,65 +164,136 @@ def get_historical_ratings(handle, years):
     
     return results
 
-def load_handles():
-    """Load handles from the handles file."""
+def get_historical_ratings(handle, years, rating_history=None):
+    """Get historical ratings for a handle for specific months in different years.
+
+    If rating_history is not given it is fetched from the API.
+    """
+    # Use March 15 of each specified year
+    dates = [datetime(year, 3, 15) for year in years]
+    results = get_snapshot_ratings(handle, dates, rating_history)
+    if results is None:
+        return None
+    
+    for year, result in zip(years, results):
+        result["year"] = year
+    
+    return results
+
+def check_legacy_handles():
+    """Point out a private_handles.txt that has not been imported into handles.txt.
+
+    It is not imported automatically: every handle in handles.txt is tracked by
+    a plain cf_tracker.py run, so adding a cohort has to be a deliberate step.
+    """
+    if not os.path.exists(LEGACY_HANDLES_FILE):
+        return
+    if os.path.exists(HANDLES_FILE) and LEGACY_GROUP in handle_registry.list_groups(HANDLES_FILE):
+        return
+    
+    print(f"Note: {LEGACY_HANDLES_FILE} is no longer read. To keep using its handles, import them as a group "
+          f"with: python3 add_handles.py --group {LEGACY_GROUP} < {LEGACY_HANDLES_FILE}")
+
+def load_handles(group=None):
+    """Load handles from the handles file (optionally only one group)."""
+    check_legacy_handles()
     if not os.path.exists(HANDLES_FILE):
         print(f"Error: {HANDLES_FILE} not found.")
         return []
     
-    with open(HANDLES_FILE, "r") as f:
-        handles = [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
-    
+    handles = handle_registry.load_handles(HANDLES_FILE, group)
+    if not handles and group:
+        print(f"No handles found in group {group} of {HANDLES_FILE}.")
     return handles
 
+def add_fetch_arguments(parser):
+    """Add the option choosing how rating histories are fetched to an argument parser."""
+    parser.add_argument("--fetch", choices=FETCH_STRATEGIES, default=FETCH_STRATEGY,
+                        help="fetch histories per handle (user.rating), per contest (contest.ratingChanges), "
+                             "or whichever needs fewer API calls (default: %(default)s)")
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Show historical Codeforces ratings for a list of handles.")
+    parser.add_argument("handles", nargs="*", help=f"handles to look up (default: read from {HANDLES_FILE})")
+    parser.add_argument("--group", help=f"only look up the handles in this group of {HANDLES_FILE}")
+    snapshots.add_date_arguments(parser)
+    add_fetch_arguments(parser)
+    metrics.add_arguments(parser)
+    return parser.parse_args()
+
 def main():
     """Main function."""
-    if len(sys.argv) > 1:
-        handles = [handle.strip() for handle in sys.argv[1:]]
+    args = parse_args()
+    metrics.METRICS_FILE = args.metrics
+    try:
+        show_historical_ratings(args)
+    finally:
+        if metrics.save():
+            print(f"Metrics saved to {metrics.METRICS_FILE}")
+
+def show_historical_ratings(args):
+    """Fetch and print the historical ratings asked for on the command line."""
+    if args.handles:
+        handles = [handle.strip() for handle in args.handles]
     else:
-        handles = load_handles()
+        handles = load_handles(args.group)
     
     if not handles:
         print("No handles provided. Please add handles to handles.txt or provide them as command-line arguments.")
         return
     
-    # Target years for March
-    years = [2022, 2023, 2024]
-    
-    table_data = []
+    try:
+        step = snapshots.grid_step(args)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
     
-    for handle in handles:
-        print(f"Fetching historical data for {handle}...")
-        historical_data = get_historical_ratings(handle, years)
+    print(f"Fetching historical data for {len(handles)} handles...")
+    try:
+        histories = fetch_rating_histories(handles, strategy=args.fetch)
+        if step == "contest":
+            # Contest dates are only known once every history has been fetched
+            histories = list(histories)
+        dates = snapshots.dates_from_args(args, [history for _, history in histories] if step == "contest" else None)
         
-        if historical_data:
-            row = [handle]
-            
-            for data in historical_data:
-                if data["rating"] is not None:
-                    rank_display = colorize_rank(data["rank"].title())
-                    row.append(f"{data['rating']} ({rank_display})")
-                    row.append(data["contest_date"])
-                else:
-                    row.append("N/A")
-                    row.append("N/A")
-            
-            table_data.append(row)
-        else:
-            row = [handle] + ["N/A", "N/A"] * len(years)
-            table_data.append(row)
+        table_data = []
         
-        # Add a small delay to avoid hitting API rate limits
-        time.sleep(1)
+        for handle, rating_history in histories:
+            print(f"Fetched historical data for {handle}")
+            historical_data = get_snapshot_ratings(handle, dates, rating_history, args.mode)
+            
+            if historical_data:
+                row = [handle]
+                
+                for data in historical_data:
+                    if data["rating"] is not None:
+                        rank_display = ranks.colorize_rank(data["rank"].title())
+                        row.append(f"{data['rating']} ({rank_display})")
+                        row.append(data["contest_date"])
+                    else:
+                        row.append("N/A")
+                        row.append("N/A")
+                
+                table_data.append(row)
+            else:
+                row = [handle] + ["N/A", "N/A"] * len(dates)
+                table_data.append(row)
+    except cf_api.APIUnavailableError as e:
+        print(f"Error: {e}")
+        return
     
     # Create headers for the table
     headers = ["Handle"]
-    for year in years:
-        headers.extend([f"March {year}", "Contest Date"])
+    for date in dates:
+        headers.extend([snapshots.date_label(date, step), "Contest Date"])
     
     # Print the table
-    print("\nHistorical Codeforces Ratings for March:")
+    if step == "year":
+        print(f"\nHistorical Codeforces Ratings for {dates[0].strftime('%B') if dates else 'March'}:")
+    else:
+        print("\nHistorical Codeforces Ratings:")
     print(tabulate(table_data, headers=headers, tablefmt="grid"))
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
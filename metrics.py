@@ -0,0 +1,189 @@
+"""
+Run metrics: counters, latency histograms and per-stage timings.
+
+cf_api records every API call (by method and outcome), the bytes received,
+call latency, JSON decoding time and the time spent waiting for the rate
+limiter or before retries; the scripts time their stages with stage(). At the
+end of a run the metrics can be saved as a JSON run report or, if the file
+name ends in .prom, as a Prometheus textfile for node_exporter's textfile
+collector:
+
+    CF_METRICS_FILE=metrics/cf_tracker.prom python3 cf_tracker.py
+    python3 export_historical_csv.py --metrics run_report.json
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+import contextlib
+from datetime import datetime
+from atomic_file import atomic_write
+
+# Constants
+# File the metrics of a run are saved to (unset disables saving)
+METRICS_FILE = os.getenv("CF_METRICS_FILE")
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+PROMETHEUS_SUFFIX = ".prom"
+
+DESCRIPTIONS = {
+    "cf_api_calls_total": "Codeforces API calls made, by method and outcome.",
+    "cf_api_response_bytes_total": "Bytes received in Codeforces API responses, by method and outcome.",
+    "cf_api_latency_seconds": "Time from sending an API request to receiving the whole response.",
+    "cf_api_decode_seconds_total": "Time spent decoding API responses as JSON.",
+    "cf_api_rate_limit_wait_seconds_total": "Time spent waiting for the API rate limiter.",
+    "cf_api_retry_wait_seconds_total": "Time spent backing off before retrying failed API calls.",
+    "cf_stage_seconds_total": "Wall time spent in each stage of the run.",
+    "cf_run_duration_seconds": "Wall time of the whole run.",
+    "cf_run_finished_timestamp_seconds": "Unix time at which the metrics were saved."
+}
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> {"buckets", "counts", "sum", "count"}
+_started_at = datetime.now()
+_start = time.perf_counter()
+
+def label_key(labels):
+    """Return a hashable, ordered form of a metric's labels."""
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def inc(name, value=1, **labels):
+    """Add value to a counter."""
+    key = (name, label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Record one observation in a histogram."""
+    key = (name, label_key(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = {"buckets": list(buckets), "counts": [0] * (len(buckets) + 1), "sum": 0.0, "count": 0}
+            _histograms[key] = histogram
+        histogram["counts"][bisect.bisect_left(histogram["buckets"], value)] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+@contextlib.contextmanager
+def stage(name):
+    """Add the wall time spent in the with block to the stage's total."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        inc("cf_stage_seconds_total", time.perf_counter() - start, stage=name)
+
+def reset():
+    """Forget everything recorded so far and restart the run clock."""
+    global _started_at, _start
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _started_at = datetime.now()
+        _start = time.perf_counter()
+
+def cumulative_buckets(histogram):
+    """Yield (upper bound, observations at or below it) for each bucket of a histogram, like Prometheus."""
+    cumulative = 0
+    for bound, count in zip(histogram["buckets"] + ["+Inf"], histogram["counts"]):
+        cumulative += count
+        yield str(bound), cumulative
+
+def report():
+    """Return the metrics recorded so far as a JSON-serializable run report."""
+    with _lock:
+        counters = [
+            {"name": name, "labels": dict(labels), "value": round(value, 6)}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+        histograms = [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": histogram["count"],
+                "sum": round(histogram["sum"], 6),
+                "buckets": dict(cumulative_buckets(histogram))
+            }
+            for (name, labels), histogram in sorted(_histograms.items())
+        ]
+    return {
+        "script": os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+        "started_at": _started_at.isoformat(),
+        "finished_at": datetime.now().isoformat(),
+        "duration_seconds": round(time.perf_counter() - _start, 3),
+        "counters": counters,
+        "histograms": histograms
+    }
+
+def format_labels(labels, extra=()):
+    """Format labels as a Prometheus label set, e.g. {method="user.info"}."""
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+def to_prometheus():
+    """Return the metrics recorded so far in the Prometheus text exposition format."""
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    with _lock:
+        for (name, labels), value in sorted(_counters.items()):
+            describe(name, "counter")
+            # repr keeps every digit; :g would round large byte counts to 6 significant digits
+            lines.append(f"{name}{format_labels(labels)} {value!r}")
+
+        for (name, labels), histogram in sorted(_histograms.items()):
+            describe(name, "histogram")
+            for bound, count in cumulative_buckets(histogram):
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']!r}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+
+    describe("cf_run_duration_seconds", "gauge")
+    lines.append(f"cf_run_duration_seconds {time.perf_counter() - _start!r}")
+    describe("cf_run_finished_timestamp_seconds", "gauge")
+    lines.append(f"cf_run_finished_timestamp_seconds {time.time():.0f}")
+    return "\n".join(lines) + "\n"
+
+def save(path=None):
+    """Save the metrics to path (default: METRICS_FILE), if one is set.
+
+    Files ending in .prom are written as a Prometheus textfile, anything else
+    as a JSON run report. The file is replaced atomically, so a collector never
+    reads a half-written one. Returns the path written, or None.
+    """
+    path = path or METRICS_FILE
+    if not path:
+        return None
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with atomic_write(path, backups=0) as f:
+        if path.endswith(PROMETHEUS_SUFFIX):
+            f.write(to_prometheus())
+        else:
+            json.dump(report(), f, indent=2)
+    return path
+
+def add_arguments(parser):
+    """Add the option choosing where metrics are saved to an argument parser."""
+    parser.add_argument("--metrics", metavar="FILE", default=METRICS_FILE,
+                        help="save run metrics to FILE: a Prometheus textfile if it ends in .prom, "
+                             "otherwise a JSON run report (default: $CF_METRICS_FILE)")
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Codeforces API, for offline runs and load tests.
+
+Replays responses recorded with CF_RECORD_DIR and, with --synthetic, makes up
+deterministic users, rating histories and contests for anything that was not
+recorded. Latency and errors can be injected to exercise the retry logic.
+
+    python3 mock_api_server.py --fixtures recordings --port 8000
+    CF_API_BASE_URL=http://127.0.0.1:8000/api python3 cf_tracker.py
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import cf_api
+import ranks
+
+# Constants
+DEFAULT_PORT = 8000
+# Synthetic data: contests held between these times, and the share of the
+# synthetic roster taking part in each one
+SYNTHETIC_CONTESTS = 100
+SYNTHETIC_START = 1420070400  # 2015-01-01
+SYNTHETIC_END = 1735689600  # 2025-01-01
+PARTICIPATION = 0.3
+
+def load_fixtures(directory):
+    """Load recorded responses from a directory.
+
+    Returns (responses, users, invalid): responses by fixture name, plus every
+    user object and every "not found" handle seen in recorded user.info calls,
+    so handles can be served whatever chunks the client asks for.
+    """
+    responses = {}
+    users = {}
+    invalid = set()
+    if not directory or not os.path.isdir(directory):
+        return responses, users, invalid
+
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(directory, name), "r") as f:
+            fixture = json.load(f)
+        responses[name] = fixture
+
+        if fixture["method"] != "user.info":
+            continue
+        try:
+            data = json.loads(fixture["body"])
+        except ValueError:
+            continue
+        if data.get("status") == "OK":
+            for user in data["result"]:
+                users[user["handle"].lower()] = user
+        else:
+            match = cf_api.NOT_FOUND_PATTERN.search(data.get("comment", ""))
+            if match:
+                invalid.add(match.group(1).lower())
+
+    return responses, users, invalid
+
+def synthetic_handle(number):
+    """Return the name of the synthetic roster's handle with the given number."""
+    return f"user{number:06d}"
+
+def seeded(*parts):
+    """Return a random generator seeded from the given values, so synthetic data is repeatable."""
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+def synthetic_contests():
+    """Return the synthetic contest list, newest first like contest.list."""
+    step = (SYNTHETIC_END - SYNTHETIC_START) // SYNTHETIC_CONTESTS
+    contests = [
+        {
+            "id": contest_id,
+            "name": f"Synthetic Round {contest_id}",
+            "type": "CF",
+            "phase": "FINISHED",
+            "durationSeconds": 7200,
+            "startTimeSeconds": SYNTHETIC_START + (contest_id - 1) * step
+        }
+        for contest_id in range(1, SYNTHETIC_CONTESTS + 1)
+    ]
+    return contests[::-1]
+
+def synthetic_change(handle, contest):
+    """Return a handle's rating change in a synthetic contest, or None if it did not take part."""
+    rnd = seeded(handle.lower(), contest["id"])
+    if rnd.random() >= PARTICIPATION:
+        return None
+    new_rating = seeded(handle.lower()).randint(800, 2800) + rnd.randint(-150, 150)
+    return {
+        "contestId": contest["id"],
+        "contestName": contest["name"],
+        "handle": handle,
+        "rank": rnd.randint(1, 20000),
+        "ratingUpdateTimeSeconds": rating_update_time(contest),
+        "oldRating": new_rating - rnd.randint(-100, 100),
+        "newRating": new_rating
+    }
+
+def rating_update_time(contest):
+    """Return the time at which a synthetic contest's ratings were updated."""
+    return contest["startTimeSeconds"] + contest["durationSeconds"] + 3600
+
+def synthetic_history(handle):
+    """Return a synthetic user.rating history."""
+    changes = (synthetic_change(handle, contest) for contest in reversed(synthetic_contests()))
+    return [change for change in changes if change]
+
+def synthetic_user(handle):
+    """Return a synthetic user.info object.
+
+    The rating is drawn around the same base rating as the handle's synthetic
+    history, without generating the whole history, so that large rosters can
+    be served quickly.
+    """
+    rnd = seeded(handle.lower())
+    rating = rnd.randint(800, 2800)
+    max_rating = rating + rnd.randint(0, 200)
+    return {
+        "handle": handle,
+        "rating": rating,
+        "rank": ranks.rank_from_rating(rating),
+        "maxRating": max_rating,
+        "maxRank": ranks.rank_from_rating(max_rating),
+        "lastOnlineTimeSeconds": SYNTHETIC_END
+    }
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    """Answers Codeforces API calls from fixtures or synthetic data."""
+
+    def log_message(self, format, *args):
+        if self.server.config["verbose"]:
+            super().log_message(format, *args)
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def fail(self, status, comment):
+        self.send_json(status, {"status": "FAILED", "comment": comment})
+
+    def do_GET(self):
+        config = self.server.config
+        url = urllib.parse.urlsplit(self.path)
+        method = url.path.rstrip("/").rsplit("/", 1)[-1]
+        params = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+
+        with self.server.lock:
+            self.server.stats[method] = self.server.stats.get(method, 0) + 1
+
+        if config["latency"] or config["jitter"]:
+            time.sleep(max(0, random.gauss(config["latency"], config["jitter"])) / 1000)
+
+        if config["max_url_bytes"] and len(self.path) > config["max_url_bytes"]:
+            self.send_response(414)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        roll = random.random()
+        if roll < config["error_rate"]:
+            headers = {"Retry-After": str(config["retry_after"])} if config["retry_after"] else None
+            return self.send_json(config["error_status"], {"status": "FAILED", "comment": "Injected error"}, headers)
+        if roll < config["error_rate"] + config["limit_rate"]:
+            return self.fail(503, "Call limit exceeded")
+
+        fixture = self.server.responses.get(cf_api.fixture_name(method, params))
+        if fixture:
+            body = fixture["body"].encode()
+            self.send_response(fixture["status"])
+            self.send_header("Content-Type", "application/json;charset=UTF-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if method == "user.info":
+            return self.user_info(params.get("handles", ""))
+        if not config["synthetic"]:
+            return self.fail(404, f"No recorded response for {method} {params}")
+        if method == "user.rating":
+            return self.send_json(200, {"status": "OK", "result": synthetic_history(params.get("handle", ""))})
+        if method == "contest.list":
+            return self.send_json(200, {"status": "OK", "result": synthetic_contests()})
+        if method == "contest.ratingChanges":
+            return self.rating_changes(params.get("contestId", ""))
+        self.fail(400, f"Method {method} is not supported by the mock server")
+
+    def user_info(self, handles):
+        """Answer user.info from recorded users, falling back to synthetic ones."""
+        config = self.server.config
+        result = []
+        for handle in handles.split(";"):
+            user = self.server.users.get(handle.lower())
+            if user is None and config["synthetic"] and handle.lower() not in self.server.invalid \
+                    and not handle.lower().startswith("invalid"):
+                user = synthetic_user(handle)
+            if user is None:
+                return self.fail(400, f"handles: User with handle {handle} not found")
+            result.append(user)
+        self.send_json(200, {"status": "OK", "result": result})
+
+    def rating_changes(self, contest_id):
+        """Answer contest.ratingChanges for a synthetic contest from the synthetic roster."""
+        contest = next((c for c in synthetic_contests() if str(c["id"]) == contest_id), None)
+        if contest is None:
+            return self.fail(400, f"contestId: Contest with id {contest_id} not found")
+        changes = (synthetic_change(synthetic_handle(n), contest) for n in range(self.server.config["roster_size"]))
+        self.send_json(200, {"status": "OK", "result": [change for change in changes if change]})
+
+def start_server(port=0, fixtures=None, synthetic=False, roster_size=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_status=503, retry_after=0, limit_rate=0.0, max_url_bytes=0, verbose=False):
+    """Start the mock server in a background thread and return it.
+
+    The API is served at http://127.0.0.1:<server.server_port>/api, and
+    server.stats counts the calls made to each method.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockAPIHandler)
+    server.daemon_threads = True
+    server.responses, server.users, server.invalid = load_fixtures(fixtures)
+    server.stats = {}
+    server.lock = threading.Lock()
+    server.config = {
+        "synthetic": synthetic,
+        "roster_size": roster_size,
+        "latency": latency,
+        "jitter": jitter,
+        "error_rate": error_rate,
+        "error_status": error_status,
+        "retry_after": retry_after,
+        "limit_rate": limit_rate,
+        "max_url_bytes": max_url_bytes,
+        "verbose": verbose
+    }
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Serve recorded or synthetic Codeforces API responses locally.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on (default: %(default)s)")
+    parser.add_argument("--fixtures", default=cf_api.RECORD_DIR,
+                        help="directory of responses recorded with CF_RECORD_DIR (default: $CF_RECORD_DIR)")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="make up users, histories and contests for calls that were not recorded")
+    parser.add_argument("--roster-size", type=int, default=0,
+                        help=f"number of synthetic handles ({synthetic_handle(0)}, {synthetic_handle(1)}, ...) "
+                             "returned by contest.ratingChanges")
+    parser.add_argument("--latency", type=float, default=0, help="mean delay per response in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0, help="standard deviation of the delay in milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of calls answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected errors (default: 503)")
+    parser.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds sent with injected errors")
+    parser.add_argument("--limit-rate", type=float, default=0, help='fraction of calls answered with "Call limit exceeded"')
+    parser.add_argument("--max-url-bytes", type=int, default=0, help="reject longer request URLs with HTTP 414")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    return parser.parse_args()
+
+def main():
+    """Run the mock server until interrupted."""
+    args = parse_args()
+    server = start_server(
+        args.port, args.fixtures, args.synthetic, args.roster_size, args.latency, args.jitter,
+        args.error_rate, args.error_status, args.retry_after, args.limit_rate, args.max_url_bytes, args.verbose
+    )
+    print(f"Loaded {len(server.responses)} recorded responses ({len(server.users)} users).")
+    print(f"Serving the Codeforces API at http://127.0.0.1:{server.server_port}/api. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Codeforces rank tables shared by all the scripts.
+
+Everything here is computed once at import time: the rank ordering, the
+rank -> ordinal and rank -> color lookups, and the rating thresholds used to
+map ratings to ranks with a binary search (or NumPy, for whole arrays).
+"""
+
+import bisect
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+# Ranks from lowest to highest
+RANK_ORDER = ["unrated", "newbie", "pupil", "specialist", "expert", "candidate master",
+              "master", "international master", "grandmaster", "international grandmaster", "legendary grandmaster"]
+RANK_ORDINAL = {rank: ordinal for ordinal, rank in enumerate(RANK_ORDER)}
+
+# Lowest rating of each rated rank above newbie; RATED_RANKS[i] covers ratings
+# from RATING_THRESHOLDS[i - 1] up to (not including) RATING_THRESHOLDS[i]
+RATING_THRESHOLDS = [1200, 1400, 1600, 1900, 2100, 2300, 2400, 2600, 3000]
+RATED_RANKS = RANK_ORDER[1:]
+
+# ANSI color codes for different ranks
+RANK_COLORS = {
+    "newbie": "\033[90m",  # Gray
+    "pupil": "\033[92m",  # Green
+    "specialist": "\033[96m",  # Cyan
+    "expert": "\033[94m",  # Blue
+    "candidate master": "\033[95m",  # Purple
+    "master": "\033[93m",  # Yellow
+    "international master": "\033[93m",  # Yellow
+    "grandmaster": "\033[91m",  # Red
+    "international grandmaster": "\033[91m",  # Red
+    "legendary grandmaster": "\033[91m",  # Red
+}
+RESET_COLOR = "\033[0m"  # Reset color
+
+if np is not None:
+    _THRESHOLD_ARRAY = np.array(RATING_THRESHOLDS)
+    _RANK_ARRAY = np.array(RATED_RANKS, dtype=object)
+
+def rank_from_rating(rating):
+    """Get the rank name based on the rating."""
+    return RATED_RANKS[bisect.bisect_right(RATING_THRESHOLDS, rating)]
+
+def ranks_from_ratings(ratings):
+    """Map a sequence of ratings to rank names in one pass; None stays None."""
+    if np is not None:
+        values = np.array([-1 if rating is None else rating for rating in ratings])
+        names = _RANK_ARRAY[np.searchsorted(_THRESHOLD_ARRAY, values, side="right")]
+        return [None if rating is None else name for rating, name in zip(ratings, names.tolist())]
+    return [None if rating is None else rank_from_rating(rating) for rating in ratings]
+
+def rank_ordinal(rank):
+    """Get the position of a rank in RANK_ORDER, or -1 for unknown ranks."""
+    return RANK_ORDINAL.get((rank or "").lower(), -1)
+
+def rank_color(rank):
+    """Get the ANSI color code for a Codeforces rank."""
+    return RANK_COLORS.get((rank or "").lower(), RESET_COLOR)
+
+def colorize_rank(rank):
+    """Add color to a rank string."""
+    return f"{RANK_COLORS.get(rank.lower(), '')}{rank}{RESET_COLOR}"
@@ -0,0 +1,142 @@
+"""
+On-disk cache of Codeforces rating histories (user.rating results).
+
+Past contests never change, so a cached history only needs to be downloaded
+again after the user takes part in a new rated contest. Each sync asks
+contest.list for recently finished contests and contest.ratingChanges for
+their participants, and drops the cached histories of anyone who took part.
+"""
+
+import os
+import json
+import time
+import cf_api
+from atomic_file import atomic_write
+
+# Constants
+RATING_CACHE_FILE = os.getenv("CF_RATING_CACHE_FILE", "rating_cache.json")
+# Rating changes are usually published within a day or two of a contest ending;
+# contests that finished this recently are re-checked until they appear.
+PENDING_WINDOW = 3 * 86400
+# Returned by get_contest_rating_changes when the API could not be reached
+REQUEST_FAILED = object()
+
+def empty_cache():
+    """Return a new, empty cache structure."""
+    return {"synced_at": 0, "checked_contests": {}, "histories": {}}
+
+def load_cache():
+    """Load the rating cache from disk."""
+    if not os.path.exists(RATING_CACHE_FILE):
+        return empty_cache()
+
+    try:
+        with open(RATING_CACHE_FILE, "r") as f:
+            cache = json.load(f)
+    except json.JSONDecodeError:
+        print(f"Error: {RATING_CACHE_FILE} is corrupted. Starting with an empty cache.")
+        return empty_cache()
+
+    for key, value in empty_cache().items():
+        cache.setdefault(key, value)
+    return cache
+
+def save_cache(cache):
+    """Save the rating cache to disk, replacing it atomically."""
+    with atomic_write(RATING_CACHE_FILE, backups=0) as f:
+        # json.dumps encodes in one pass with the C encoder; json.dump streams
+        # through the much slower pure-Python one
+        f.write(json.dumps(cache, separators=(",", ":")))
+
+def lookup(cache, handle):
+    """Return the cached rating history for a handle, or None if it is not cached."""
+    entry = cache["histories"].get(handle.lower())
+    return entry["history"] if entry else None
+
+def store(cache, handle, history):
+    """Store a freshly downloaded rating history for a handle."""
+    cache["histories"][handle.lower()] = {
+        "handle": handle,
+        "history": history,
+        "fetched_at": int(time.time())
+    }
+
+def get_contest_list():
+    """Return all (non-gym) contests, including upcoming ones, or None on failure."""
+    return cf_api.get_result("contest.list", {"gym": "false"})
+
+def contest_end_time(contest):
+    """Return the timestamp at which a contest ends."""
+    return contest.get("startTimeSeconds", 0) + contest.get("durationSeconds", 0)
+
+def get_finished_contests(since):
+    """Return finished (non-gym) contests that ended after the given timestamp."""
+    contests = get_contest_list()
+    if contests is None:
+        return None
+
+    finished = []
+    for contest in contests:
+        if contest.get("phase") == "FINISHED" and contest_end_time(contest) > since:
+            finished.append(contest)
+
+    finished.sort(key=contest_end_time)
+    return finished
+
+def get_contest_rating_changes(contest_id):
+    """Return the rating changes of a contest, or None if they are not available yet.
+
+    Returns REQUEST_FAILED if the request failed, which says nothing about the
+    contest and must not be mistaken for an unrated one.
+    """
+    return cf_api.get_result("contest.ratingChanges", {"contestId": contest_id}, on_error=REQUEST_FAILED)
+
+def sync(cache):
+    """Drop cached histories of users who took part in a contest since the last sync.
+
+    Returns False if the contest list or a contest's rating changes could not
+    be fetched, in which case the cache should not be trusted for this run.
+    """
+    now = int(time.time())
+
+    if not cache["histories"]:
+        # Nothing cached, so there is nothing to invalidate
+        cache["synced_at"] = now
+        return True
+
+    since = cache["synced_at"] - PENDING_WINDOW
+    contests = get_finished_contests(since)
+    if contests is None:
+        return False
+
+    checked = cache["checked_contests"]
+    contests = [c for c in contests if str(c["id"]) not in checked]
+
+    if len(contests) > len(cache["histories"]):
+        # Re-downloading every cached history is cheaper than checking each contest
+        print(f"Rating cache is {len(contests)} contests behind. Refreshing all cached histories.")
+        cache["histories"] = {}
+    else:
+        for contest in contests:
+            end_time = contest_end_time(contest)
+            changes = get_contest_rating_changes(contest["id"])
+            if changes is REQUEST_FAILED:
+                return False
+
+            if not changes:
+                # Not published yet, or an unrated contest; give up once the window has passed
+                if end_time < now - PENDING_WINDOW:
+                    checked[str(contest["id"])] = end_time
+                continue
+
+            for change in changes:
+                cache["histories"].pop(change["handle"].lower(), None)
+            checked[str(contest["id"])] = end_time
+
+    # Contests older than the window are never looked at again
+    cache["checked_contests"] = {
+        contest_id: end_time for contest_id, end_time in checked.items()
+        if end_time >= now - 2 * PENDING_WINDOW
+    }
+    cache["synced_at"] = now
+    return True
@@ -0,0 +1,185 @@
+"""
+Snapshot engine for historical ratings: evaluates rating histories on an
+arbitrary grid of dates (yearly, monthly, weekly, daily or per contest).
+
+Each handle's history is matched against the whole date grid in a single
+sorted pass (NumPy searchsorted when NumPy is installed, a merge walk
+otherwise) instead of scanning the history once per date.
+"""
+
+import calendar
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+# Ratings further than this from a target date are not reported in "closest" mode
+RATING_WINDOW_SECONDS = 7776000  # 90 days in seconds
+GRID_STEPS = ["day", "week", "month", "year", "contest"]
+SNAPSHOT_MODES = ["closest", "last"]
+# Default snapshots: March 15 of each of these years
+DEFAULT_YEARS = [2022, 2023, 2024]
+
+def build_rating_index(rating_history):
+    """Build a sorted index of a rating history for bisect-based date lookups.
+
+    Returns (entries, timestamps): the history sorted by update time and the
+    matching list of ratingUpdateTimeSeconds values.
+    """
+    entries = rating_history
+    timestamps = [entry["ratingUpdateTimeSeconds"] for entry in entries]
+
+    # The API returns histories in chronological order; only sort if needed
+    if any(timestamps[i] > timestamps[i + 1] for i in range(len(timestamps) - 1)):
+        entries = sorted(rating_history, key=lambda x: x["ratingUpdateTimeSeconds"])
+        timestamps = [entry["ratingUpdateTimeSeconds"] for entry in entries]
+
+    return entries, timestamps
+
+def is_within_window(entry, target_timestamp):
+    """Check whether a rating entry is within RATING_WINDOW_SECONDS of the target."""
+    return abs(entry["ratingUpdateTimeSeconds"] - target_timestamp) <= RATING_WINDOW_SECONDS
+
+def search_sorted(timestamps, targets, side="left"):
+    """Return insertion points of sorted targets into sorted timestamps (like bisect)."""
+    if np is not None:
+        return np.searchsorted(np.asarray(timestamps), np.asarray(targets), side=side).tolist()
+
+    # Both lists are sorted, so one merge walk finds every position
+    positions = []
+    i = 0
+    for target in targets:
+        while i < len(timestamps) and (timestamps[i] < target or (side == "right" and timestamps[i] == target)):
+            i += 1
+        positions.append(i)
+    return positions
+
+def snapshot_history(rating_history, dates, mode="closest", index=None):
+    """Evaluate one rating history at every date in a single pass.
+
+    In "closest" mode each date gets the rating update nearest to it, if within
+    RATING_WINDOW_SECONDS; in "last" mode it gets the last update at or before
+    it. Returns a list of history entries (or None) aligned with dates.
+    """
+    row = [None] * len(dates)
+    if not rating_history or not dates:
+        return row
+
+    entries, timestamps = index or build_rating_index(rating_history)
+    targets = [int(date.timestamp()) for date in dates]
+    order = sorted(range(len(targets)), key=targets.__getitem__)
+    sorted_targets = [targets[i] for i in order]
+
+    if mode == "last":
+        positions = search_sorted(timestamps, sorted_targets, side="right")
+        for i, position in zip(order, positions):
+            row[i] = entries[position - 1] if position else None
+        return row
+
+    positions = search_sorted(timestamps, sorted_targets, side="left")
+    for i, position in zip(order, positions):
+        target = targets[i]
+        # The closest update is either the last one before the target or the first one after it
+        candidates = entries[max(position - 1, 0):position + 1]
+        closest = min(candidates, key=lambda x: abs(x["ratingUpdateTimeSeconds"] - target))
+        if is_within_window(closest, target):
+            row[i] = closest
+    return row
+
+def rating_matrix(histories, dates, mode="closest"):
+    """Build a handles x dates matrix of ratings.
+
+    histories maps handle -> rating history. Returns a dict mapping each handle
+    to a list of ratings (or None) aligned with dates.
+    """
+    matrix = {}
+    for handle, rating_history in histories.items():
+        row = snapshot_history(rating_history, dates, mode)
+        matrix[handle] = [entry["newRating"] if entry else None for entry in row]
+    return matrix
+
+def add_months(date, months):
+    """Add a number of months to a date, clamping the day to the month's length."""
+    month_index = date.month - 1 + months
+    year = date.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(date.day, calendar.monthrange(year, month)[1])
+    return date.replace(year=year, month=month, day=day)
+
+def date_grid(start, end, step="month"):
+    """Return the dates from start to end (inclusive) spaced by a day, week, month or year."""
+    dates = []
+    count = 0
+    date = start
+    while date <= end:
+        dates.append(date)
+        count += 1
+        if step == "day":
+            date = start + timedelta(days=count)
+        elif step == "week":
+            date = start + timedelta(weeks=count)
+        elif step == "month":
+            date = add_months(start, count)
+        elif step == "year":
+            date = add_months(start, 12 * count)
+        else:
+            raise ValueError(f"Unknown date step: {step}")
+    return dates
+
+def contest_dates(histories, start=None, end=None):
+    """Return the distinct dates of every rated contest found in the given histories."""
+    days = set()
+    for rating_history in histories:
+        for entry in rating_history:
+            day = datetime.fromtimestamp(entry["ratingUpdateTimeSeconds"]).replace(hour=0, minute=0, second=0, microsecond=0)
+            if (start is None or day >= start) and (end is None or day <= end):
+                days.add(day)
+    return sorted(days)
+
+def date_label(date, step="year"):
+    """Return the column label used for a snapshot date."""
+    if step in ("month", "year"):
+        return date.strftime("%B %Y")
+    return date.strftime("%Y-%m-%d")
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD command-line date."""
+    return datetime.strptime(value, "%Y-%m-%d")
+
+def add_date_arguments(parser):
+    """Add the date-grid options shared by the historical scripts to an ArgumentParser."""
+    parser.add_argument("--years", type=int, nargs="+", default=DEFAULT_YEARS,
+                        help="years to snapshot on --month/--day (default: %(default)s)")
+    parser.add_argument("--month", type=int, default=3, help="month of the yearly snapshot (default: 3)")
+    parser.add_argument("--day", type=int, default=15, help="day of the yearly snapshot (default: 15)")
+    parser.add_argument("--start", type=parse_date, help="first snapshot date (YYYY-MM-DD); enables --every")
+    parser.add_argument("--end", type=parse_date, help="last snapshot date (YYYY-MM-DD, default: today)")
+    parser.add_argument("--every", choices=GRID_STEPS,
+                        help="spacing of snapshots between --start and --end (default: month), or one per contest")
+    parser.add_argument("--mode", choices=SNAPSHOT_MODES, default="closest",
+                        help="closest: nearest contest within 90 days; last: last rating at or before the date")
+
+def grid_step(args):
+    """Return the grid step selected by the parsed arguments."""
+    if args.every == "contest":
+        return "contest"
+    if args.start:
+        return args.every or "month"
+    if args.every:
+        raise ValueError(f"--every {args.every} requires --start")
+    return "year"
+
+def dates_from_args(args, histories=None):
+    """Build the snapshot dates selected by the parsed arguments.
+
+    The "contest" step needs the rating histories, since its dates are the
+    contests the handles actually took part in.
+    """
+    step = grid_step(args)
+    if step == "contest":
+        return contest_dates(histories or [], args.start, args.end)
+    if args.start:
+        return date_grid(args.start, args.end or datetime.now(), step)
+    return [datetime(year, args.month, args.day) for year in args.years]
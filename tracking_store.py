@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Append-only time-series store for tracked Codeforces data.
+
+Every cf_tracker.py run appends one row per handle to a SQLite database, so the
+full history of polls is kept instead of only the latest snapshot. Point-in-time
+queries ("rating on date X", "change since last week") use an index on
+(handle, polled_at) and never load the whole history. The latest poll of each
+handle is also kept in a small table of its own, so the current snapshot is
+read without looking at the history at all.
+
+Run it directly to query the store:
+
+    python3 tracking_store.py at 2024-03-15 [handles...]
+    python3 tracking_store.py since 2024-03-08 [handles...]
+"""
+
+import os
+import sys
+import sqlite3
+from datetime import datetime, timedelta
+from tabulate import tabulate
+
+# Constants
+TRACKING_DB_FILE = os.getenv("CF_TRACKING_DB", "tracking.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS polls (
+    handle TEXT NOT NULL,
+    polled_at INTEGER NOT NULL,
+    last_updated TEXT NOT NULL,
+    rating INTEGER,
+    rank TEXT,
+    max_rating INTEGER,
+    max_rank TEXT
+);
+CREATE INDEX IF NOT EXISTS polls_handle_time ON polls (handle, polled_at);
+CREATE TABLE IF NOT EXISTS latest (
+    handle TEXT PRIMARY KEY,
+    polled_at INTEGER NOT NULL,
+    last_updated TEXT NOT NULL,
+    rating INTEGER,
+    rank TEXT,
+    max_rating INTEGER,
+    max_rank TEXT
+);
+"""
+
+COLUMNS = "handle, polled_at, last_updated, rating, rank, max_rating, max_rank"
+# Longer handle lists are filtered in Python to stay under SQLite's variable limit
+MAX_SQL_HANDLES = 500
+
+def connect():
+    """Open the tracking database, creating the schema if needed."""
+    conn = sqlite3.connect(TRACKING_DB_FILE)
+    conn.executescript(SCHEMA)
+    # Stores created before the latest table existed fill it in once
+    if conn.execute("SELECT 1 FROM latest LIMIT 1").fetchone() is None \
+            and conn.execute("SELECT 1 FROM polls LIMIT 1").fetchone() is not None:
+        with conn:
+            refresh_latest(conn)
+    return conn
+
+def latest_poll_query(before=False):
+    """Return SQL selecting the rowid of a handle's latest poll (at or before a time).
+
+    Polls are stored with one-second resolution, so polls made in the same
+    second are told apart by insertion order.
+    """
+    time_condition = "AND polled_at <= ? " if before else ""
+    return (
+        f"SELECT rowid FROM polls WHERE handle = handles.handle {time_condition}"
+        f"ORDER BY polled_at DESC, rowid DESC LIMIT 1"
+    )
+
+def refresh_latest(conn, handles=None):
+    """Rebuild the latest table from the polls of the given handles (default: all).
+
+    Handles are matched ignoring case.
+    """
+    if handles is None:
+        conn.execute("DELETE FROM latest")
+        selected = "SELECT DISTINCT handle FROM polls"
+        params = []
+    else:
+        placeholders = ", ".join("?" for _ in handles)
+        conn.execute(f"DELETE FROM latest WHERE handle COLLATE NOCASE IN ({placeholders})", list(handles))
+        selected = f"SELECT DISTINCT handle FROM polls WHERE handle COLLATE NOCASE IN ({placeholders})"
+        params = list(handles)
+    conn.execute(
+        f"INSERT INTO latest ({COLUMNS}) SELECT {COLUMNS} FROM polls WHERE rowid IN "
+        f"(SELECT ({latest_poll_query()}) FROM ({selected}) AS handles)",
+        params
+    )
+
+def exists():
+    """Check whether the tracking database has been created yet."""
+    return os.path.exists(TRACKING_DB_FILE)
+
+def to_timestamp(value):
+    """Convert an ISO date string or datetime to a unix timestamp."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp())
+
+def row_to_record(row):
+    """Convert a polls row into the record format used by cf_tracker."""
+    handle, _, last_updated, rating, rank, max_rating, max_rank = row
+    return {
+        "handle": handle,
+        "rating": rating,
+        "rank": rank,
+        "max_rating": max_rating,
+        "max_rank": max_rank,
+        "last_updated": last_updated
+    }
+
+def record_poll(data):
+    """Append one poll (a dict of handle -> record, as built by cf_tracker) to the store."""
+    rows = []
+    for handle, record in data.items():
+        last_updated = record.get("last_updated") or datetime.now().isoformat()
+        rows.append((
+            handle,
+            to_timestamp(last_updated),
+            last_updated,
+            record.get("rating", 0),
+            record.get("rank", "unrated"),
+            record.get("max_rating", 0),
+            record.get("max_rank", "unrated")
+        ))
+
+    conn = connect()
+    try:
+        with conn:
+            conn.executemany(f"INSERT INTO polls ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            # A later poll in the same second replaces an earlier one, like in polls
+            conn.executemany(
+                f"INSERT INTO latest ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                f"ON CONFLICT (handle) DO UPDATE SET "
+                f"polled_at = excluded.polled_at, last_updated = excluded.last_updated, "
+                f"rating = excluded.rating, rank = excluded.rank, "
+                f"max_rating = excluded.max_rating, max_rank = excluded.max_rank "
+                f"WHERE excluded.polled_at >= latest.polled_at",
+                rows
+            )
+    finally:
+        conn.close()
+
+def snapshot_query(handles=None, before=None, order_by=None):
+    """Build the SQL (and parameters) selecting each handle's latest poll at or before a time.
+
+    Without a time, the latest table is read directly; with one, each handle
+    in it is looked up in the (handle, polled_at) index.
+    """
+    where = ""
+    params = []
+    if handles is not None and len(handles) <= MAX_SQL_HANDLES:
+        where = f"WHERE handle IN ({', '.join('?' for _ in handles)})"
+        params.extend(handles)
+
+    if before is None:
+        query = f"SELECT {COLUMNS} FROM latest {where}"
+    else:
+        query = (
+            f"SELECT {COLUMNS} FROM polls WHERE rowid IN "
+            f"(SELECT ({latest_poll_query(before=True)}) FROM (SELECT handle FROM latest {where}) AS handles)"
+        )
+        # The time placeholder comes before the handle ones in the query text
+        params.insert(0, to_timestamp(before))
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    return query, params
+
+def snapshot(handles=None, before=None):
+    """Return each handle's latest record at or before a time (default: now).
+
+    The result has the same shape as user_data.json: handle -> record.
+    """
+    if not exists():
+        return {}
+
+    query, params = snapshot_query(handles, before)
+    wanted = set(handles) if handles is not None else None
+    conn = connect()
+    try:
+        return {
+            row[0]: row_to_record(row) for row in conn.execute(query, params)
+            if wanted is None or row[0] in wanted
+        }
+    finally:
+        conn.close()
+
+def iter_snapshot(handles=None, before=None, order_by=None):
+    """Yield each handle's latest record at or before a time, one at a time.
+
+    Unlike snapshot(), rows are streamed from the database cursor, so memory
+    use does not grow with the number of handles.
+    """
+    if not exists():
+        return
+
+    query, params = snapshot_query(handles, before, order_by)
+    wanted = set(handles) if handles is not None else None
+    conn = connect()
+    try:
+        for row in conn.execute(query, params):
+            if wanted is None or row[0] in wanted:
+                yield row_to_record(row)
+    finally:
+        conn.close()
+
+def latest_snapshot(handles=None):
+    """Return the most recent record of every handle in the store."""
+    return snapshot(handles)
+
+def iter_polls(handles=None):
+    """Yield every poll in the store as (handle, polled_at, rating, rank), ordered by handle and time."""
+    if not exists():
+        return
+
+    conditions = ""
+    params = []
+    if handles is not None and len(handles) <= MAX_SQL_HANDLES:
+        conditions = f"WHERE handle IN ({', '.join('?' for _ in handles)}) "
+        params = list(handles)
+    wanted = set(handles) if handles is not None else None
+
+    conn = connect()
+    try:
+        query = f"SELECT handle, polled_at, rating, rank FROM polls {conditions}ORDER BY handle, polled_at"
+        for row in conn.execute(query, params):
+            if wanted is None or row[0] in wanted:
+                yield row
+    finally:
+        conn.close()
+
+def rating_at(handle, when):
+    """Return a handle's rating as last polled at or before a time, or None."""
+    record = snapshot([handle], when).get(handle)
+    return record["rating"] if record else None
+
+def changes_since(when, handles=None):
+    """Return rating changes between a past time and the latest poll.
+
+    Returns a dict of handle -> (previous_rating, current_rating) for handles
+    polled both before and after the given time.
+    """
+    previous = snapshot(handles, when)
+    current = latest_snapshot(handles)
+    return {
+        handle: (previous[handle]["rating"], record["rating"])
+        for handle, record in current.items()
+        if handle in previous
+    }
+
+def rename_handles(renames):
+    """Move the stored polls of renamed (or re-cased) handles to their new handle.
+
+    renames maps old handles to new ones; old handles are matched ignoring case.
+    """
+    if not renames or not exists():
+        return
+
+    conn = connect()
+    try:
+        with conn:
+            conn.executemany(
+                "UPDATE polls SET handle = ? WHERE handle = ? COLLATE NOCASE",
+                ((new, old) for old, new in renames.items())
+            )
+            handles = list(renames) + list(renames.values())
+            for start in range(0, len(handles), MAX_SQL_HANDLES):
+                refresh_latest(conn, handles[start:start + MAX_SQL_HANDLES])
+    finally:
+        conn.close()
+
+def import_snapshot(data):
+    """Seed an empty store with an existing snapshot (e.g. from user_data.json)."""
+    if data and not latest_snapshot():
+        record_poll(data)
+
+def main():
+    """Query the store from the command line."""
+    if len(sys.argv) < 3 or sys.argv[1] not in ("at", "since"):
+        print("Usage: python3 tracking_store.py at|since YYYY-MM-DD [handles...]")
+        return
+
+    command = sys.argv[1]
+    # Include the whole day given on the command line
+    when = datetime.fromisoformat(sys.argv[2]) + timedelta(days=1) - timedelta(seconds=1)
+    handles = sys.argv[3:] or None
+
+    if not exists():
+        print(f"Error: {TRACKING_DB_FILE} not found. Run cf_tracker.py first.")
+        return
+
+    if command == "at":
+        rows = [
+            [handle, record["rating"], record["rank"], record["last_updated"]]
+            for handle, record in sorted(snapshot(handles, when).items(), key=lambda x: -x[1]["rating"])
+        ]
+        print(tabulate(rows, headers=["Handle", "Rating", "Rank", "Polled At"], tablefmt="pretty"))
+    else:
+        rows = [
+            [handle, old, new, new - old]
+            for handle, (old, new) in sorted(changes_since(when, handles).items(), key=lambda x: x[1][0] - x[1][1])
+        ]
+        print(tabulate(rows, headers=["Handle", "Then", "Now", "Change"], tablefmt="pretty"))
+
+if __name__ == "__main__":
+    main()
@@ -5,64 +5,23 @@ Utility script to validate Codeforces handles before adding them to the handles.
 
 import os
 import sys
-import requests
-import time
-import hashlib
-import random
-import urllib.parse  # Add this import for URL encoding
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+import argparse
+import cf_api
+import handle_registry
 
 HANDLES_FILE = "handles.txt"
-API_BASE_URL = "https://codeforces.com/api"
-API_KEY = os.getenv("CODEFORCES_API_KEY")
-API_SECRET = os.getenv("CODEFORCES_SECRET")
 
-def create_authenticated_url(method_name, params=None):
-    """Create an authenticated URL for Codeforces API."""
-    if not API_KEY or not API_SECRET:
-        print("Warning: API key or secret not found. Using unauthenticated request.")
-        query_params = "&".join([f"{k}={v}" for k, v in (params or {}).items()])
-        return f"{API_BASE_URL}/{method_name}?{query_params}"
-    
-    if params is None:
-        params = {}
-    
-    # Add authentication parameters
-    params["apiKey"] = API_KEY
-    params["time"] = str(int(time.time()))
-    
-    # Generate random string for additional security
-    rand = str(random.randint(100000, 999999))
-    
-    # Create signature string
-    # Note: We use the raw (unencoded) values for the signature
-    param_strings = []
-    for key in sorted(params.keys()):
-        param_strings.append(f"{key}={params[key]}")
-    
-    signature_string = f"{rand}/{method_name}?{'&'.join(param_strings)}#{API_SECRET}"
-    
-    # Calculate SHA512 hash
-    signature = hashlib.sha512(signature_string.encode()).hexdigest()
-    
-    # Build the final URL with URL-encoded parameter values
-    encoded_params = {}
-    for key, value in params.items():
-        # Don't encode the apiKey and time parameters
-        if key in ["apiKey", "time"]:
-            encoded_params[key] = value
-        else:
-            # Only encode the value, not the key
-            encoded_params[key] = urllib.parse.quote(value)
-    
-    query_params = "&".join([f"{k}={v}" for k, v in encoded_params.items()])
-    return f"{API_BASE_URL}/{method_name}?{query_params}&apiSig={rand}{signature}"
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description=f"Validate Codeforces handles and add the valid ones to {HANDLES_FILE}.")
+    parser.add_argument("--group", help="add the valid handles to this group")
+    parser.add_argument("--check-only", action="store_true",
+                        help=f"only report which handles are valid, without adding them to {HANDLES_FILE}")
+    return parser.parse_args()
 
 def validate_handles():
     """Validate Codeforces handles and add valid ones to the handles.txt file."""
+    args = parse_args()
     print("Enter Codeforces handles (one per line). Press Ctrl+D (Unix) or Ctrl+Z (Windows) when done:")
     
     # Read handles from stdin
@@ -80,164 +39,89 @@ def validate_handles():
         print("No handles provided. Exiting.")
         return
     
-    # Read existing handles to avoid duplicates
-    existing_handles = set()
-    if os.path.exists(HANDLES_FILE):
-        with open(HANDLES_FILE, "r") as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#"):
-                    existing_handles.add(line)
-    
-    # Filter out handles that already exist
-    new_handles = [h for h in handles if h not in existing_handles]
+    # Filter out handles that already exist (ignoring case)
+    existing_handles = handle_registry.load_index(HANDLES_FILE) if os.path.exists(HANDLES_FILE) else {}
+    new_handles = {}
+    for handle in handles:
+        key = handle_registry.normalize(handle)
+        if key not in existing_handles and key not in new_handles:
+            new_handles[key] = handle
+    new_handles = list(new_handles.values())
+    
+    if args.group and not args.check_only:
+        # Handles already in the file were validated before; just add them to the group
+        known_handles = [existing_handles[handle_registry.normalize(h)] for h in handles
+                         if handle_registry.normalize(h) in existing_handles]
+        grouped = handle_registry.add_handles(HANDLES_FILE, known_handles, args.group)
+        if grouped:
+            print(f"Added {len(grouped)} handles already in {HANDLES_FILE} to group {args.group}.")
     
     if not new_handles:
         print("All handles already exist in the file. No changes made.")
         return
     
-    print(f"Validating {len(new_handles)} new handles...")
+    # Only handles without a fresh cached result are sent to the API
+    results = handle_registry.cached_validations(new_handles)
+    to_check = [h for h in new_handles if handle_registry.normalize(h) not in results]
+    print(f"Validating {len(new_handles)} new handles ({len(new_handles) - len(to_check)} cached)...")
     
-    # Validate handles with the Codeforces API
-    valid_handles = []
-    invalid_handles = []
-    
-    # Process handles in chunks to avoid API rate limits and URL length limitations
-    chunk_size = 20  # Reduced from 100 to 20
-    
-    print(f"Processing {len(new_handles)} handles in chunks of {chunk_size}...")
-    
-    for i in range(0, len(new_handles), chunk_size):
-        chunk = new_handles[i:i+chunk_size]
-        # URL encode each handle to handle special characters
-        encoded_handles = [urllib.parse.quote(handle) for handle in chunk]
-        handles_param = ";".join(encoded_handles)
-        
-        print(f"Processing handles {i+1}-{min(i+chunk_size, len(new_handles))} of {len(new_handles)}...")
-        
+    if to_check:
+        # Chunks are sized to the URL length limit rather than a fixed handle count
+        # Failed chunks are bisected and "not found" handles dropped from them
         try:
-            # Basic request without authentication (works for most cases)
-            url = f"{API_BASE_URL}/user.info?handles={handles_param}"
-            
-            # If API key and secret are available, use authenticated request
-            if API_KEY and API_SECRET:
-                url = create_authenticated_url("user.info", {"handles": handles_param})
-            
-            response = requests.get(url)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data["status"] == "OK":
-                    # All handles in this chunk are valid
-                    valid_handles.extend(chunk)
-                    print(f"  ✓ All handles in this chunk are valid")
-                else:
-                    # Some error occurred, treat all as invalid for now
-                    invalid_handles.extend(chunk)
-                    print(f"  ✗ API Error: {data.get('comment', 'Unknown error')}")
-            elif response.status_code == 400:
-                # This usually means some handles are invalid
-                data = response.json()
-                error_msg = data.get("comment", "")
-                
-                # Try to extract the invalid handle from the error message
-                # Example error: "handles: User with handle invalid_handle not found"
-                if "not found" in error_msg:
-                    parts = error_msg.split("handle ")
-                    if len(parts) > 1:
-                        invalid_handle = parts[1].split(" ")[0]
-                        invalid_handles.append(invalid_handle)
-                        # The rest are potentially valid
-                        valid_handles.extend([h for h in chunk if h != invalid_handle])
-                    else:
-                        # Can't determine which is invalid, validate one by one
-                        for handle in chunk:
-                            if validate_single_handle(handle):
-                                valid_handles.append(handle)
-                            else:
-                                invalid_handles.append(handle)
-                else:
-                    # Can't determine which is invalid, validate one by one
-                    for handle in chunk:
-                        if validate_single_handle(handle):
-                            valid_handles.append(handle)
-                        else:
-                            invalid_handles.append(handle)
-            else:
-                print(f"API Error: Status code {response.status_code}")
-                print(f"Failed to process handles as a group. Trying individual validation...")
-                # Validate one by one as a fallback
-                for handle in chunk:
-                    if validate_single_handle(handle):
-                        valid_handles.append(handle)
-                        print(f"  ✓ {handle} is valid")
-                    else:
-                        invalid_handles.append(handle)
-                        print(f"  ✗ {handle} is invalid")
-            
-            # Be nice to the API - increase delay between requests
-            time.sleep(2)  # Increased from 1 to 2 seconds
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Request Error: {e}")
-            print(f"Failed to process handles as a group. Trying individual validation...")
-            # Validate one by one as a fallback
-            for handle in chunk:
-                if validate_single_handle(handle):
-                    valid_handles.append(handle)
-                    print(f"  ✓ {handle} is valid")
-                else:
-                    invalid_handles.append(handle)
-                    print(f"  ✗ {handle} is invalid")
+            users, invalid = cf_api.fetch_user_info(to_check)
+        except cf_api.APIUnavailableError as e:
+            print(f"Error: {e}")
+            return
+        results.update(handle_registry.record_validations(users, invalid))
     
-    # Remove duplicates while preserving order
-    valid_handles = list(dict.fromkeys(valid_handles))
-    invalid_handles = list(dict.fromkeys(invalid_handles))
+    valid_handles = []
+    renamed_handles = []
+    invalid_handles = []
+    unchecked_handles = []
+    for handle in new_handles:
+        result = results.get(handle_registry.normalize(handle))
+        if result is None:
+            unchecked_handles.append(handle)
+        elif result["status"] == "invalid":
+            invalid_handles.append(handle)
+        elif result["status"] == "renamed":
+            renamed_handles.append((handle, result["handle"]))
+        else:
+            # Use the canonical casing returned by the API
+            valid_handles.append(result["handle"])
     
     # Report results
     if valid_handles:
         print(f"\nValid handles ({len(valid_handles)}):")
         for handle in valid_handles:
             print(f"  ✓ {handle}")
-        
-        # Append valid handles to the file
-        with open(HANDLES_FILE, "a") as f:
-            for handle in valid_handles:
-                f.write(f"{handle}\n")
-        
-        print(f"\nAdded {len(valid_handles)} new handles to {HANDLES_FILE}.")
     else:
         print("\nNo valid handles found.")
     
+    if renamed_handles:
+        print(f"\nRenamed handles ({len(renamed_handles)}), the new handle is used:")
+        for old_handle, new_handle in renamed_handles:
+            print(f"  ↪ {old_handle} -> {new_handle}")
+    
     if invalid_handles:
         print(f"\nInvalid handles ({len(invalid_handles)}):")
         for handle in invalid_handles:
             print(f"  ✗ {handle}")
     
-    print(f"\nTotal handles in file: {len(existing_handles) + len(valid_handles)}")
-
-def validate_single_handle(handle):
-    """Validate a single Codeforces handle."""
-    try:
-        # URL encode the handle to handle special characters
-        encoded_handle = urllib.parse.quote(handle)
-        
-        # Basic request without authentication (works for most cases)
-        url = f"{API_BASE_URL}/user.info?handles={encoded_handle}"
-        
-        # If API key and secret are available, use authenticated request
-        if API_KEY and API_SECRET:
-            url = create_authenticated_url("user.info", {"handles": encoded_handle})
-        
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data["status"] == "OK"
-        
-        return False
-    except requests.exceptions.RequestException:
-        return False
+    if unchecked_handles:
+        print(f"\nCould not validate ({len(unchecked_handles)}), not added:")
+        for handle in unchecked_handles:
+            print(f"  ? {handle}")
+    
+    if args.check_only:
+        print(f"\nCheck only: {HANDLES_FILE} was not changed.")
+        return
+    
+    # Append valid handles to the file
+    added = handle_registry.add_handles(HANDLES_FILE, valid_handles + [new for _, new in renamed_handles], args.group)
+    print(f"\nAdded {len(added)} new handles to {HANDLES_FILE}.")
+    print(f"Total handles in file: {len(existing_handles) + len(added)}")
 
 if __name__ == "__main__":
     validate_handles() 
\ No newline at end of file